@@ -1,19 +1,21 @@
-import heapq
 import random # To test the sorting, see below
 import time   # To count the sorting execution
 
 class PriorityQueue():
     """
-    Custom PriorityQueue implementation using the
-    library heapq.py for the impementation of heap
+    Custom PriorityQueue implementation as an indexed binary heap.
+    Every entry of the heap is a list [priority, order, item, position]
+    and a position map keeps for every item its entries on the heap,
+    so that push, pop and update (decrease-key) cost O(log n).
+    Items with equal priority are popped in insertion (FIFO) order.
     Source: https://docs.python.org/3/library/heapq.html
     """
     
     def __init__(self):
         self.heap = [] # Initializing an empty heap 
         self.count = 0 # Number of elements in heap
-        self.items_state = {} # A dictionary to keep the items and their priorities (keys are items and values are lists)
-        self.items_on_heap = set() # A set that keep tracks of the unique items on heap
+        self.order = 0 # Insertion counter used for FIFO tie-breaking
+        self.items_state = {} # Position map: keys are items and values are lists with their heap entries
         
     def isEmpty(self):
         """
@@ -27,16 +29,8 @@ class PriorityQueue():
         an item with the same priority then the method doesn't
         insert the item in order to avoid duplicates.
         """
-        p = self.check_duplicate(item, priority)
-        if p == 1: # The pair (item, priority) is not contained in heap, push the element
-            heapq.heappush(self.heap, (priority, item)) # Implements the heappush of heapq library
-            self.count+=1
-            self.items_on_heap.add(item)
-            self.items_state[item] = [priority]
-        elif p == 2:
-            heapq.heappush(self.heap, (priority, item))
-            self.count+=1
-            self.items_state[item] += [priority]
+        if self.check_duplicate(item, priority) != -1:
+            self._insert(item, priority)
             
     
     def pop(self):
@@ -44,9 +38,9 @@ class PriorityQueue():
         Returns the item of the queue with the minimum priority
         """
         if self.count != 0: # If queue is non empty do the job
-            self.count-=1
-            value = heapq.heappop(self.heap)[1]
-            return value
+            entry = self.heap[0]
+            self._remove(entry)
+            return entry[2]
         else:
             print("Queue is empty!")
     
@@ -59,23 +53,17 @@ class PriorityQueue():
         no action and if the item is not contained in heap the method
         pushes the pair (item, priority).
         """
-        if item not in self.items_on_heap: # Perform a simple push
-            self.items_on_heap.add(item)
-            self.items_state[item] = [priority]
-            self.count += 1
-            heapq.heappush(self.heap, (priority, item))
+        if item not in self.items_state: # Perform a simple push
+            self._insert(item, priority)
         else: # The item is contained in heap
-            if priority < min(self.items_state[item]): # Update
-                self.count = 0
-                temp_heap = self.heap
-                self.heap = []
-                for value_h, item_h in temp_heap:
-                    if item_h != item:
-                        heapq.heappush(self.heap, (value_h,item_h))
-                        self.count +=1
-                heapq.heappush(self.heap,(priority,item))
-                self.count+=1
-                self.items_state[item] = [priority]
+            entries = self.items_state[item]
+            best = min(entries)
+            if priority < best[0]: # Update
+                for entry in list(entries):
+                    if entry is not best:
+                        self._remove(entry)
+                best[0] = priority # Decrease-key of the remaining entry
+                self._sift_up(best[3])
                         
             
     def check_duplicate(self,item, priority):
@@ -86,12 +74,78 @@ class PriorityQueue():
         none of the items has the insertion priority it returns 2,
         if the pair (item,priority) is contained in heap, it returns -1.
         """
-        if item in self.items_on_heap and priority in self.items_state[item]:
+        if item not in self.items_state:
+            return 1
+        elif any(entry[0] == priority for entry in self.items_state[item]):
             return -1
-        elif item in self.items_on_heap and not priority in self.items_state[item]:
-            return 2
         else:
-            return 1
+            return 2
+
+    def _insert(self, item, priority):
+        """
+        Appends a new entry at the bottom of the heap and sifts it up
+        """
+        entry = [priority, self.order, item, self.count]
+        self.order += 1
+        self.heap.append(entry)
+        self.count += 1
+        self.items_state.setdefault(item, []).append(entry)
+        self._sift_up(entry[3])
+
+    def _remove(self, entry):
+        """
+        Removes an arbitrary entry from the heap using its position
+        """
+        entries = self.items_state[entry[2]]
+        entries.remove(entry)
+        if not entries:
+            del self.items_state[entry[2]]
+        last = self.heap.pop()
+        self.count -= 1
+        if last is not entry:
+            pos = entry[3]
+            last[3] = pos
+            self.heap[pos] = last
+            self._sift_down(pos)
+            self._sift_up(last[3])
+
+    def _sift_up(self, pos):
+        """
+        Moves the entry at pos towards the root while it is smaller than its parent
+        """
+        heap = self.heap
+        entry = heap[pos]
+        while pos > 0:
+            parent_pos = (pos - 1) >> 1
+            parent = heap[parent_pos]
+            if not entry < parent:
+                break
+            parent[3] = pos
+            heap[pos] = parent
+            pos = parent_pos
+        entry[3] = pos
+        heap[pos] = entry
+
+    def _sift_down(self, pos):
+        """
+        Moves the entry at pos towards the leaves while a child is smaller
+        """
+        heap = self.heap
+        entry = heap[pos]
+        child_pos = 2 * pos + 1
+        while child_pos < self.count:
+            right_pos = child_pos + 1
+            if right_pos < self.count and heap[right_pos] < heap[child_pos]:
+                child_pos = right_pos
+            child = heap[child_pos]
+            if not child < entry:
+                break
+            child[3] = pos
+            heap[pos] = child
+            pos = child_pos
+            child_pos = 2 * pos + 1
+        entry[3] = pos
+        heap[pos] = entry
         
 def PQSort(unsorted_list):
     """
@@ -19,8 +19,9 @@ Pacman agents (in searchAgents.py).
 
 import util
 
-from custom_functions import expand_tree, tree_node
-from custom_functions import get_path
+from custom_functions import graph_search
+from custom_functions import get_predecessors, join_paths
+from custom_functions import sma_node, state_key
 
 class SearchProblem:
     """
@@ -94,20 +95,10 @@ def depthFirstSearch(problem: SearchProblem):
     # My implementation of GraphSearch with DFS
     # DFS is implemented using a stack 
     fringe = util.Stack() # Initialize an empty stack
-    closed = []
-    starting_node = tree_node(state = problem.getStartState(),
-                              ParentNode=None, Action=None, PathCost=0,
-                              Depth=0) # Initialize the Starting node
-    fringe.push(starting_node) # Append the starting node in stack
-    while not fringe.isEmpty():
-        node = fringe.pop()
-        if problem.isGoalState(node.state): # Then we have found the goal state
-            return get_path(node) # Return the path that leads to the goal
-        elif node.state not in closed:
-            closed.append(node.state)
-            fringe = expand_tree(node, fringe, problem, mode = "DFS")
-    if fringe.isEmpty():
-        print(f"- Search algorithm finished without reaching to a solution.")
+    path = graph_search(problem, fringe, mode = "DFS")
+    if path is not None:
+        return path # Return the path that leads to the goal
+    print(f"- Search algorithm finished without reaching to a solution.")
     util.raiseNotDefined()
 
 def breadthFirstSearch(problem: SearchProblem):
@@ -117,20 +108,10 @@ def breadthFirstSearch(problem: SearchProblem):
     # My BFS Iplementation of GraphSearch with BFS
     # BFS is implemented using a queue
     fringe = util.Queue() # Initialize an empty queue
-    closed = []
-    starting_node = tree_node(state = problem.getStartState(),
-                              ParentNode=None, Action=None, PathCost=0,
-                              Depth=0) # Initialize the Starting node
-    fringe.push(starting_node) # Append the starting node in queue
-    while not fringe.isEmpty():
-        node = fringe.pop()
-        if problem.isGoalState(node.state): # Then we have found the goal state
-            return get_path(node) # Return the path that leads to the goal
-        elif node.state not in closed:
-            closed.append(node.state)
-            fringe = expand_tree(node, fringe, problem, mode = "BFS")
-    if fringe.isEmpty():
-        print(f"- Search algorithm finished without reaching to a solution.")
+    path = graph_search(problem, fringe, mode = "BFS")
+    if path is not None:
+        return path # Return the path that leads to the goal
+    print(f"- Search algorithm finished without reaching to a solution.")
      
     util.raiseNotDefined()
 
@@ -143,21 +124,10 @@ def uniformCostSearch(problem: SearchProblem):
     # node with the minimum cost path has the highest priority
     
     fringe = util.PriorityQueue() # Initialize an empty priority Queue
-    closed = []
-    starting_node = tree_node(state = problem.getStartState(),
-                              ParentNode=None, Action=None, PathCost=0,
-                              Depth=0) # Initialize the Starting node
-    fringe.push(starting_node, starting_node.pathcost) # Append the starting node in queue
-    while not fringe.isEmpty():
-        node = fringe.pop()
-        if problem.isGoalState(node.state): # Then we have found the goal state
-            return get_path(node) # Return the path that leads to the goal
-        elif node.state not in closed:
-            closed.append(node.state)
-            priority = node.pathcost
-            fringe = expand_tree(node = node, fringe = fringe, problem = problem, mode = "UCS")
-    if fringe.isEmpty():
-        print(f"- Search algorithm finished without reaching to a solution.")
+    path = graph_search(problem, fringe, mode = "UCS")
+    if path is not None:
+        return path # Return the path that leads to the goal
+    print(f"- Search algorithm finished without reaching to a solution.")
     
     util.raiseNotDefined()
 
@@ -176,31 +146,268 @@ def aStarSearch(problem: SearchProblem, heuristic=nullHeuristic):
     "*** YOUR CODE HERE ***"
     
     # My implementation of aStar algorithm
-    # We use a queue with function as a data structure
-    fringe = util.PriorityQueue() # Initialize an empty priority Queue/L1 distance
-    closed = []
-    starting_node = tree_node(state = problem.getStartState(),
-                              ParentNode=None, Action=None, PathCost=0,
-                              Depth=0) # Initialize the Starting node
-    priority = starting_node.pathcost+heuristic(starting_node.state, problem)
-    fringe.push(starting_node, priority) # Append the starting node in queue
-    while not fringe.isEmpty():
-        node = fringe.pop()
-        if problem.isGoalState(node.state): # Then we have found the goal state
-            return get_path(node) # Return the path that leads to the goal
-        elif node.state not in closed:
-            priority = node.pathcost + heuristic(node.state, problem) # The priority is the sum of pathcost + heuristic
-            closed.append(node.state)
-            fringe = expand_tree(node = node, fringe = fringe, problem = problem, 
-                                 mode = "aStar", heuristic=heuristic)
-    if fringe.isEmpty():
-        print(f"- Search algorithm finished without reaching to a solution.")
+    # The priority of a node is the sum of pathcost + heuristic
+    fringe = util.PriorityQueue() # Initialize an empty priority Queue
+    path = graph_search(problem, fringe, mode = "aStar", heuristic = heuristic)
+    if path is not None:
+        return path # Return the path that leads to the goal
+    print(f"- Search algorithm finished without reaching to a solution.")
     
     util.raiseNotDefined()
 
+def bidirectionalBreadthFirstSearch(problem: SearchProblem):
+    """
+    Search the shallowest nodes from the start and from the goal at the
+    same time, one whole layer of the smaller frontier at a time.
+
+    The problem must have a single goal state problem.goal and reversible
+    moves, like the PositionSearchProblem.
+    """
+    start, goal = problem.getStartState(), problem.goal
+    if problem.isGoalState(start):
+        return []
+    # A side is (frontier, parents, depths, neighbours), parents map a state to
+    # its (previous state, action) on the forward side and (next state, action)
+    # on the backward side
+    forward = ([start], {start: None}, {start: 0}, problem.getSuccessors)
+    backward = ([goal], {goal: None}, {goal: 0}, lambda state: get_predecessors(problem, state))
+    while forward[0] and backward[0]:
+        side, other = (forward, backward) if len(forward[0]) <= len(backward[0]) else (backward, forward)
+        frontier, parents, depths, neighbours = side
+        best_length, meeting = float("inf"), None
+        next_frontier = []
+        for state in frontier: # Expand the whole layer
+            for successor, action, _ in neighbours(state):
+                if successor not in parents:
+                    parents[successor] = (state, action)
+                    depths[successor] = depths[state] + 1
+                    next_frontier.append(successor)
+                    if successor in other[2] and depths[successor] + other[2][successor] < best_length:
+                        best_length, meeting = depths[successor] + other[2][successor], successor
+        if meeting is not None:
+            return join_paths(meeting, forward[1], backward[1])
+        frontier[:] = next_frontier
+    print(f"- Search algorithm finished without reaching to a solution.")
+    util.raiseNotDefined()
+
+def bidirectionalAStarSearch(problem: SearchProblem, heuristic=nullHeuristic):
+    """
+    Front-to-end bidirectional A*. The forward search uses the heuristic to
+    the goal hF and the backward search the heuristic to the start hB,
+    through a copy of the problem whose goal is the start state. With the
+    average potential p(n) = (hF(n) - hB(n)) / 2 as the forward and -p(n) as
+    the backward heuristic both searches are Dijkstra on the same
+    non-negative reduced costs, so the search can stop as soon as the sum
+    of the two minimum keys reaches the cost of the best path met so far.
+    The heuristic must be consistent for the path to be optimal.
+
+    The problem must have a single goal state problem.goal and reversible
+    moves, like the PositionSearchProblem.
+    """
+    import copy
+    start, goal = problem.getStartState(), problem.goal
+    if problem.isGoalState(start):
+        return []
+    reverse_problem = copy.copy(problem)
+    reverse_problem.goal = start
+    potential = lambda state: (heuristic(state, problem) - heuristic(state, reverse_problem)) / 2
+    # A side is (fringe, path costs, parents, closed, neighbours, sign of the potential)
+    forward = (util.PriorityQueue(), {start: 0}, {start: None}, set(), problem.getSuccessors, 1)
+    backward = (util.PriorityQueue(), {goal: 0}, {goal: None}, set(),
+                lambda state: get_predecessors(problem, state), -1)
+    forward[0].push(start, potential(start))
+    backward[0].push(goal, -potential(goal))
+    best_cost, meeting = float("inf"), None
+    while not forward[0].isEmpty() and not backward[0].isEmpty():
+        forward_key, backward_key = forward[0].heap[0][0], backward[0].heap[0][0]
+        if forward_key + backward_key >= best_cost: # No shorter path is left
+            break
+        side, other = (forward, backward) if forward_key <= backward_key else (backward, forward)
+        fringe, pathcosts, parents, closed, neighbours, sign = side
+        state = fringe.pop()
+        closed.add(state)
+        for successor, action, cost in neighbours(state):
+            if successor in closed:
+                continue
+            pathcost = pathcosts[state] + cost
+            if successor not in pathcosts or pathcost < pathcosts[successor]:
+                pathcosts[successor] = pathcost
+                parents[successor] = (state, action)
+                fringe.update(successor, pathcost + sign * potential(successor))
+                if successor in other[1] and pathcost + other[1][successor] < best_cost:
+                    best_cost, meeting = pathcost + other[1][successor], successor
+    if meeting is None:
+        print(f"- Search algorithm finished without reaching to a solution.")
+        util.raiseNotDefined()
+    return join_paths(meeting, forward[2], backward[2])
+
+def iterativeDeepeningAStarSearch(problem: SearchProblem, heuristic=nullHeuristic):
+    """
+    IDA*: a series of depth-first searches, each one bounded by an f-cost
+    limit which is raised to the smallest f-cost that exceeded it in the
+    previous iteration. Only the current path is kept in memory, and
+    states already on the path are not visited again.
+    """
+    start = problem.getStartState()
+    actions, on_path = [], set([state_key(start)])
+
+    def bounded_search(state, pathcost, bound):
+        """
+        Returns True if the goal is reached within the bound, otherwise the
+        smallest f-cost of the nodes that exceeded the bound.
+        """
+        f = pathcost + heuristic(state, problem)
+        if f > bound:
+            return f
+        if problem.isGoalState(state):
+            return True
+        next_bound = float("inf")
+        for successor, action, cost in problem.getSuccessors(state):
+            key = state_key(successor)
+            if key in on_path:
+                continue
+            on_path.add(key)
+            actions.append(action)
+            result = bounded_search(successor, pathcost + cost, bound)
+            if result is True:
+                return True
+            next_bound = min(next_bound, result)
+            actions.pop()
+            on_path.remove(key)
+        return next_bound
+
+    bound = heuristic(start, problem)
+    while bound != float("inf"):
+        result = bounded_search(start, 0, bound)
+        if result is True:
+            return actions
+        bound = result
+    print(f"- Search algorithm finished without reaching to a solution.")
+    util.raiseNotDefined()
+
+def memoryBoundedAStarSearch(problem: SearchProblem, heuristic=nullHeuristic, budget=100000):
+    """
+    SMA*: A* which keeps at most 'budget' nodes in memory. When the budget
+    is exceeded, the leaf with the highest f-cost (the shallowest among
+    equals) is forgotten and its f-cost is backed up in its parent, which
+    regenerates it when it becomes the most promising node again. Returns
+    an optimal path if one fits within the budget.
+    """
+    import heapq
+    infinity = float("inf")
+    start = problem.getStartState()
+    root = sma_node(start, None, None, 0, 0, heuristic(start, problem))
+    open_heap, leaf_heap = [], [] # Entries carry a stamp, stale entries are skipped
+    counter = [0, 1] # Pushes so far (tie-breaking), nodes in memory
+
+    def push_open(node, key):
+        node.open_version += 1
+        counter[0] += 1
+        heapq.heappush(open_heap, (key, -node.depth, counter[0], node.open_version, node))
+
+    def push_leaf(node):
+        node.leaf_version += 1
+        counter[0] += 1
+        heapq.heappush(leaf_heap, (-node.f, node.depth, counter[0], node.leaf_version, node))
+
+    def forget(node):
+        """Removes a leaf and backs up its f-cost in its parent"""
+        node.alive = False
+        counter[1] -= 1
+        parent = node.parentnode
+        del parent.children[node.action]
+        parent.forgotten[node.action] = node.f
+        push_open(parent, min(parent.forgotten.values()))
+        if not parent.children: # The parent is a leaf now
+            parent.f = max(parent.f, min(parent.forgotten.values()))
+            push_leaf(parent)
+
+    def back_up(node):
+        """Propagates the f-cost of the best child towards the root"""
+        while node is not None:
+            values = [child.f for child in node.children.values()] + list(node.forgotten.values())
+            best = min(values) if values else infinity
+            if best <= node.f:
+                break
+            node.f = best
+            node = node.parentnode
+
+    push_open(root, root.f)
+    push_leaf(root)
+    while open_heap:
+        key, _, _, version, node = heapq.heappop(open_heap)
+        if not node.alive or version != node.open_version:
+            continue
+        if key == infinity:
+            break
+        node.open_version += 1 # The node leaves the open list
+        if not node.expanded:
+            if problem.isGoalState(node.state):
+                path = []
+                while node.parentnode is not None:
+                    path.append(node.action)
+                    node = node.parentnode
+                return list(reversed(path))
+            if node.depth >= budget - 1: # The path cannot be extended within the budget
+                node.f = infinity
+                if node is not root:
+                    forget(node)
+                continue
+            node.expanded = True
+            actions = None # Generate every successor
+        else: # Regenerate the most promising forgotten successors
+            actions = [action for action, f in node.forgotten.items() if f == key]
+        on_path = set()
+        ancestor = node
+        while ancestor is not None:
+            on_path.add(state_key(ancestor.state))
+            ancestor = ancestor.parentnode
+        for successor, action, cost in problem.getSuccessors(node.state):
+            if actions is not None and action not in actions:
+                continue
+            if state_key(successor) in on_path:
+                continue
+            pathcost = node.pathcost + cost
+            f = max(node.f, pathcost + heuristic(successor, problem), node.forgotten.get(action, 0))
+            child = sma_node(successor, node, action, pathcost, node.depth + 1, f)
+            node.children[action] = child
+            counter[1] += 1
+            push_open(child, f)
+            push_leaf(child)
+        if actions is None:
+            node.forgotten = {}
+        else:
+            for action in actions:
+                del node.forgotten[action]
+            if node.forgotten:
+                push_open(node, min(node.forgotten.values()))
+        if not node.children: # Dead end
+            node.f = infinity
+            if node is root:
+                break
+            forget(node)
+            continue
+        back_up(node)
+        while counter[1] > budget: # Free memory
+            _, _, _, version, leaf = heapq.heappop(leaf_heap)
+            if not leaf.alive or version != leaf.leaf_version or leaf.children or leaf is root:
+                continue
+            forget(leaf)
+        if len(open_heap) + len(leaf_heap) > 8 * budget + 64: # Drop the stale entries
+            open_heap[:] = [e for e in open_heap if e[4].alive and e[3] == e[4].open_version]
+            leaf_heap[:] = [e for e in leaf_heap if e[4].alive and e[3] == e[4].leaf_version]
+            heapq.heapify(open_heap)
+            heapq.heapify(leaf_heap)
+    print(f"- Search algorithm finished without reaching to a solution.")
+    util.raiseNotDefined()
+
 
 # Abbreviations
 bfs = breadthFirstSearch
 dfs = depthFirstSearch
 astar = aStarSearch
 ucs = uniformCostSearch
+bdbfs = bidirectionalBreadthFirstSearch
+bdastar = bidirectionalAStarSearch
+idastar = iterativeDeepeningAStarSearch
+smastar = memoryBoundedAStarSearch
@@ -0,0 +1,239 @@
+# benchmark.py
+# ------------
+# Benchmark harness for the search functions of search.py.
+
+"""
+Runs every layout of a layouts directory with every search function and
+problem type, and records the wall time, the number of expanded nodes, the
+peak memory and the cost of the path found. The results are written to a
+JSON or CSV file, and can be compared against a saved JSON baseline:
+
+> python benchmark.py -o baseline.json
+> python benchmark.py -o results.json -b baseline.json
+
+The second command exits with status 1 and lists the regressions if a path
+cost changed, a run that used to succeed failed, more nodes were expanded,
+or the time or the peak memory grew beyond the given tolerance.
+
+The time of a run is the median of several timed repeats. The peak memory
+is measured in one more run under tracemalloc, whose overhead would
+distort the timings.
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import layout
+import pacman
+import search
+import searchAgents
+import util
+
+SEARCH_FUNCTIONS = ['dfs', 'bfs', 'ucs', 'astar']
+
+# The heuristic used by astar for each problem type
+HEURISTICS = {'PositionSearchProblem': 'manhattanHeuristic',
+              'CornersProblem': 'cornersHeuristic',
+              'FoodSearchProblem': 'foodHeuristic',
+              'BitmaskFoodSearchProblem': 'foodHeuristic'}
+
+FIELDS = ['layout', 'problem', 'function', 'status', 'time', 'expanded', 'peakMemory', 'cost']
+
+# Where the layouts are looked for, relative to this file: project1 has none
+# of its own, and shares those of project4
+LAYOUT_DIRECTORIES = ['layouts', os.path.join('..', '..', 'project4', 'logic', 'layouts')]
+
+def defaultLayoutDirectory():
+    "The first of LAYOUT_DIRECTORIES that exists, else the first one"
+    here = os.path.dirname(os.path.abspath(__file__))
+    for directory in LAYOUT_DIRECTORIES:
+        path = os.path.normpath(os.path.join(here, directory))
+        if os.path.isdir(path):
+            return path
+    return LAYOUT_DIRECTORIES[0]
+
+def makeProblem(problemType, gameState):
+    "Builds a search problem of the given type, quietly"
+    if problemType == 'PositionSearchProblem':
+        return searchAgents.PositionSearchProblem(gameState, warn=False, visualize=False)
+    return getattr(searchAgents, problemType)(gameState)
+
+def solveOnce(gameState, problemType, solve, timeout, traceMemory):
+    """
+    Solves one problem and returns (status, time, problem, actions, peak
+    memory); the peak memory is None unless traceMemory is set, as tracing
+    slows the search down.
+    """
+    status, problem, actions, peakMemory = 'ok', None, None, None
+    util.mutePrint()
+    if traceMemory:
+        tracemalloc.start()
+    startTime = time.perf_counter()
+    try:
+        problem = makeProblem(problemType, gameState)
+        actions = util.TimeoutFunction(solve, timeout)(problem)
+    except util.TimeoutFunctionException:
+        status = 'timeout'
+    except (Exception, SystemExit): # util.raiseNotDefined exits when no path is found
+        status = 'failed'
+    finally:
+        elapsed = time.perf_counter() - startTime
+        if traceMemory:
+            peakMemory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        util.unmutePrint()
+    return status, elapsed, problem, actions, peakMemory
+
+def runOne(layoutName, lay, problemType, functionName, timeout, repeats=3):
+    """
+    Solves one problem and returns its record. The status is 'ok', 'timeout'
+    or 'failed' (the search raised an exception or found no path). The time
+    is the median of repeats runs, after which one more run measures the
+    peak memory.
+    """
+    record = {'layout': layoutName, 'problem': problemType, 'function': functionName,
+              'status': 'ok', 'time': None, 'expanded': None, 'peakMemory': None, 'cost': None}
+    gameState = pacman.GameState()
+    gameState.initialize(lay, 0)
+    function = getattr(search, functionName)
+    if functionName == 'astar':
+        heuristic = getattr(searchAgents, HEURISTICS[problemType])
+        solve = lambda problem: function(problem, heuristic=heuristic)
+    else:
+        solve = function
+
+    times = []
+    for i in range(max(repeats, 1)):
+        status, elapsed, problem, actions, _ = solveOnce(gameState, problemType, solve, timeout, False)
+        times.append(elapsed)
+        if status != 'ok': # Not worth repeating
+            record['status'], record['time'] = status, elapsed
+            return record
+    record['time'] = sorted(times)[len(times) // 2]
+    record['cost'] = problem.getCostOfActions(actions)
+    record['expanded'] = problem._expanded
+    status, _, _, _, record['peakMemory'] = solveOnce(gameState, problemType, solve, timeout, True)
+    if status != 'ok':
+        record['status'] = status
+    return record
+
+def runBenchmark(layoutDirectory, layoutNames, problemTypes, functionNames, timeout, repeats=3):
+    if not os.path.isdir(layoutDirectory):
+        raise Exception('The layouts directory %s does not exist; give the directory of the .lay files with -d'
+                        % layoutDirectory)
+    if not layoutNames:
+        layoutNames = sorted(name[:-len('.lay')] for name in os.listdir(layoutDirectory) if name.endswith('.lay'))
+    records = []
+    for layoutName in layoutNames:
+        lay = layout.tryToLoad(os.path.join(layoutDirectory, layoutName + '.lay'))
+        if lay == None:
+            raise Exception('The layout %s cannot be found in %s' % (layoutName, layoutDirectory))
+        for problemType in problemTypes:
+            for functionName in functionNames:
+                record = runOne(layoutName, lay, problemType, functionName, timeout, repeats)
+                records.append(record)
+                print('%-20s %-25s %-6s %-8s %8.3fs expanded: %-8s cost: %s' %
+                      (layoutName, problemType, functionName, record['status'], record['time'],
+                       record['expanded'], record['cost']))
+    return records
+
+def writeRecords(records, path):
+    "Writes the records to path, as CSV if it ends with .csv and as JSON otherwise"
+    with open(path, 'w', newline='') as f:
+        if path.endswith('.csv'):
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+        else:
+            json.dump(records, f, indent=1)
+
+def compareWithBaseline(records, baseline, timeTolerance, memoryTolerance, minTime=0.05):
+    """
+    Returns a list of messages, one for every regression of records with
+    respect to the baseline records. Timings shorter than minTime seconds
+    are too noisy and are not compared.
+    """
+    key = lambda record: (record['layout'], record['problem'], record['function'])
+    base = dict((key(record), record) for record in baseline)
+    regressions = []
+    for record in records:
+        old = base.get(key(record))
+        if old == None:
+            continue
+        name = '%s/%s/%s' % key(record)
+        if old['status'] == 'ok' and record['status'] != 'ok':
+            regressions.append('%s: %s (was ok)' % (name, record['status']))
+            continue
+        if record['status'] != 'ok' or old['status'] != 'ok':
+            continue
+        if record['cost'] != old['cost']:
+            regressions.append('%s: path cost %s (was %s)' % (name, record['cost'], old['cost']))
+        if record['expanded'] > old['expanded']:
+            regressions.append('%s: %d nodes expanded (was %d)' % (name, record['expanded'], old['expanded']))
+        if record['time'] > max(old['time'], minTime) * (1 + timeTolerance):
+            regressions.append('%s: %.3fs (was %.3fs)' % (name, record['time'], old['time']))
+        if record['peakMemory'] > old['peakMemory'] * (1 + memoryTolerance):
+            regressions.append('%s: peak memory %d bytes (was %d)' % (name, record['peakMemory'], old['peakMemory']))
+    return regressions
+
+def readCommand(argv):
+    "Processes the command used to run the benchmark from the command line."
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python benchmark.py <options>
+    EXAMPLES:   (1) python benchmark.py -o baseline.json
+                    - Runs every layout and saves the results
+                (2) python benchmark.py -l tinyMaze,mediumMaze -f bfs,astar -b baseline.json
+                    - Compares two layouts and two functions against a baseline
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-d', '--layouts', dest='layoutDirectory', default=defaultLayoutDirectory(),
+                      help='the directory of the layouts [Default: %default]')
+    parser.add_option('-l', '--layout', dest='layoutNames', default='',
+                      help='comma separated layouts to run [Default: every layout of the directory]')
+    parser.add_option('-p', '--problems', dest='problemTypes',
+                      default='PositionSearchProblem,CornersProblem,FoodSearchProblem',
+                      help='comma separated problem types [Default: %default]')
+    parser.add_option('-f', '--functions', dest='functionNames', default=','.join(SEARCH_FUNCTIONS),
+                      help='comma separated search functions [Default: %default]')
+    parser.add_option('-t', '--timeout', dest='timeout', type='int', default=10,
+                      help='seconds allowed for a single search [Default: %default]')
+    parser.add_option('-r', '--repeats', dest='repeats', type='int', default=3,
+                      help='timed runs of each search, of which the median is kept [Default: %default]')
+    parser.add_option('-o', '--output', dest='output', default='benchmark.json',
+                      help='the results file, CSV if it ends with .csv [Default: %default]')
+    parser.add_option('-b', '--baseline', dest='baseline', default=None,
+                      help='a JSON results file to compare against')
+    parser.add_option('--timeTolerance', dest='timeTolerance', type='float', default=0.5,
+                      help='allowed relative growth of the time [Default: %default]')
+    parser.add_option('--memoryTolerance', dest='memoryTolerance', type='float', default=0.1,
+                      help='allowed relative growth of the peak memory [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    split = lambda value: [name for name in value.split(',') if name]
+    options.layoutNames = split(options.layoutNames)
+    options.problemTypes = split(options.problemTypes)
+    options.functionNames = split(options.functionNames)
+    return options
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    records = runBenchmark(options.layoutDirectory, options.layoutNames, options.problemTypes,
+                           options.functionNames, options.timeout, options.repeats)
+    writeRecords(records, options.output)
+    print('Results written to %s' % options.output)
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compareWithBaseline(records, baseline, options.timeTolerance, options.memoryTolerance)
+        if regressions:
+            print('%d REGRESSIONS against %s:' % (len(regressions), options.baseline))
+            for regression in regressions:
+                print('  ' + regression)
+            sys.exit(1)
+        print('No regressions against %s' % options.baseline)
@@ -2,46 +2,194 @@
         for Berkley's Project1
 """
 
+from array import array
 
-class tree_node():
+
+class node_store():
     """
-    Custom Class implementing the nodes
-    of the search tree for BFS, DFS, UFS etc.
+    Custom Class implementing the nodes of the search
+    tree for BFS, DFS, UFS etc. Instead of one object per
+    node, the state, parent, action, path cost and depth of
+    every node are kept in parallel arrays and a node is
+    just its integer index in them.
     """
-    def __init__(self, state, ParentNode, Action, PathCost,
-                 Depth):
-        self.state = state
-        self.parentnode = ParentNode
-        self.action = Action
-        self.pathcost = PathCost
-        self.depth = Depth
+    __slots__ = ("states", "parents", "actions", "pathcosts", "depths")
+
+    def __init__(self):
+        self.states = []
+        self.parents = array("l") # Index of the parent node, -1 for the root
+        self.actions = []
+        self.pathcosts = []
+        self.depths = array("l")
+
+    def __len__(self):
+        return len(self.states)
+
+    def add(self, state, ParentNode, Action, PathCost, Depth):
+        """Stores a new node and returns its index"""
+        self.states.append(state)
+        self.parents.append(-1 if ParentNode is None else ParentNode)
+        self.actions.append(Action)
+        self.pathcosts.append(PathCost)
+        self.depths.append(Depth)
+        return len(self.states) - 1
         
-def get_path(node):
+def get_path(node, store):
+    """Reads the actions backwards through the parent-index array"""
     moves = []
-    temp_node = node
-    while temp_node.parentnode != None:
-        moves.append(temp_node.action)
-        temp_node = temp_node.parentnode
+    parents, actions = store.parents, store.actions
+    while parents[node] != -1:
+        moves.append(actions[node])
+        node = parents[node]
     return list(reversed(moves))
+
+def state_key(state):
+    """
+    Returns a hashable key for a search state. States that
+    contain lists (e.g. a list of visited corners) are frozen
+    into tuples, so that they can be stored in a set/dict.
+    """
+    try:
+        hash(state)
+        return state
+    except TypeError:
+        if isinstance(state, (list, tuple)):
+            return tuple(state_key(s) for s in state)
+        raise
         
         
-def expand_tree(node, fringe, problem, mode = "BFS",
-                heuristic = None):
-    """Categorical variable mode determines the type of algorithm BFS/DFS/UCS etc"""
-    successors = problem.getSuccessors(node.state) # Get successors of current node
+def expand_tree(node, fringe, problem, store, mode = "BFS",
+                heuristic = None, closed = None, best_g = None):
+    """Categorical variable mode determines the type of algorithm BFS/DFS/UCS etc
+    
+    The node is an index in the node_store, and the indices of the
+    successor nodes are pushed in the fringe.
+    If the closed set is given, successors whose state is already expanded
+    are not pushed. If the best_g table is given (UCS/aStar), successors
+    that do not improve the best known path cost of their state are not
+    pushed either. Such nodes would be discarded anyway when popped, so
+    the returned paths and the order of expansions remain the same.
+    """
+    successors = problem.getSuccessors(store.states[node]) # Get successors of current node
+    node_pathcost = store.pathcosts[node]
+    depth = store.depths[node] + 1
     # Push to the data structure
     for successor in successors:
         # Successors has is a triple of the form (state, action, cost)
-        temp_node = tree_node(state = successor[0], ParentNode=node,
-                              Action=successor[1], PathCost=node.pathcost+successor[2],
-                              Depth=node.depth + 1)
+        pathcost = node_pathcost + successor[2]
+        if closed is not None or best_g is not None:
+            key = state_key(successor[0])
+            if closed is not None and key in closed:
+                continue
+            if best_g is not None:
+                if key in best_g and best_g[key] <= pathcost:
+                    continue
+                best_g[key] = pathcost
+        temp_node = store.add(state = successor[0], ParentNode=node,
+                              Action=successor[1], PathCost=pathcost,
+                              Depth=depth)
         if mode == "BFS" or mode == "DFS":
             fringe.push(temp_node)
         elif mode == "UCS":
-            priority = temp_node.pathcost
+            priority = pathcost
             fringe.update(temp_node, priority)
         elif mode == "aStar":
-            priority = temp_node.pathcost + heuristic(temp_node.state, problem)
+            priority = pathcost + heuristic(successor[0], problem)
             fringe.push(temp_node, priority)
     return fringe
 
+def graph_search(problem, fringe, mode = "BFS", heuristic = None):
+    """
+    Generic GraphSearch shared by DFS, BFS, UCS and aStar. The fringe
+    determines the order of expansions (Stack, Queue, PriorityQueue).
+    The closed list is a hashed set and UCS/aStar keep a table with the
+    best path cost found so far for each state, so duplicate detection
+    costs O(1). Returns the list of actions to the goal or None if the
+    fringe empties without reaching a goal.
+    """
+    store = node_store()
+    closed = set()
+    best_g = {} if mode in ("UCS", "aStar") else None
+    starting_node = store.add(state = problem.getStartState(),
+                              ParentNode=None, Action=None, PathCost=0,
+                              Depth=0) # Initialize the Starting node
+    if mode == "BFS" or mode == "DFS":
+        fringe.push(starting_node)
+    else:
+        start_state = store.states[starting_node]
+        best_g[state_key(start_state)] = 0
+        priority = 0 if mode == "UCS" else heuristic(start_state, problem)
+        fringe.push(starting_node, priority)
+    while not fringe.isEmpty():
+        node = fringe.pop()
+        state = store.states[node]
+        if problem.isGoalState(state): # Then we have found the goal state
+            return get_path(node, store) # Return the path that leads to the goal
+        key = state_key(state)
+        if key not in closed:
+            closed.add(key)
+            fringe = expand_tree(node = node, fringe = fringe, problem = problem,
+                                 store = store, mode = mode, heuristic = heuristic,
+                                 closed = closed, best_g = best_g)
+    return None
+
+def get_predecessors(problem, state):
+    """
+    Returns the triples (predecessor, action, stepCost) of the states
+    from which an action leads to state, for problems on a grid where
+    every move can be reversed (e.g. PositionSearchProblem). 'action' is
+    the forward action from predecessor to state. If the problem has a
+    costFn the step cost is the cost of entering state, otherwise the
+    moves are assumed to cost the same in both directions.
+    """
+    from game import Actions
+    predecessors = []
+    for successor, action, cost in problem.getSuccessors(state):
+        if hasattr(problem, "costFn"):
+            cost = problem.costFn(state)
+        predecessors.append((successor, Actions.reverseDirection(action), cost))
+    return predecessors
+
+def join_paths(meeting, forward_parents, backward_parents):
+    """
+    Builds the path of a bidirectional search through the meeting state.
+    forward_parents maps a state to (previous state, action) and
+    backward_parents maps a state to (next state, action), with None for
+    the start and the goal respectively.
+    """
+    moves = []
+    state = meeting
+    while forward_parents[state] is not None:
+        state, action = forward_parents[state]
+        moves.append(action)
+    moves.reverse()
+    state = meeting
+    while backward_parents[state] is not None:
+        state, action = backward_parents[state]
+        moves.append(action)
+    return moves
+
+class sma_node():
+    """
+    Custom Class implementing the nodes of the memory-bounded
+    A* (SMA*) search tree. Besides the usual fields, a node keeps
+    its children in memory and the backed-up f-costs of the
+    children that were forgotten to free memory.
+    """
+    __slots__ = ("state", "parentnode", "action", "pathcost", "depth", "f",
+                 "children", "forgotten", "expanded", "alive",
+                 "open_version", "leaf_version")
+
+    def __init__(self, state, ParentNode, Action, PathCost, Depth, f):
+        self.state = state
+        self.parentnode = ParentNode
+        self.action = Action
+        self.pathcost = PathCost
+        self.depth = Depth
+        self.f = f
+        self.children = {} # action -> child node in memory
+        self.forgotten = {} # action -> backed-up f of a forgotten child
+        self.expanded = False
+        self.alive = True
+        self.open_version = 0 # Stamps to recognise stale heap entries
+        self.leaf_version = 0
@@ -14,6 +14,10 @@
 
 import search
 import random
+import math
+import os
+import mmap
+import collections
 
 # Module Classes
 
@@ -25,7 +29,12 @@ class EightPuzzleState:
     This class defines the mechanics of the puzzle itself.  The
     task of recasting this puzzle as a search problem is left to
     the EightPuzzleSearchProblem class.
+
+    The puzzle may have any N x N size (N = 4 is the 15-puzzle). The
+    board is packed in a single integer with a fixed number of bits
+    per cell, so that states are small, cheap to copy and to hash.
     """
+    __slots__ = ('size', 'bits', 'board', 'blank')
 
     def __init__( self, numbers ):
         """
@@ -46,18 +55,42 @@ class EightPuzzleState:
             | 6 | 7 | 8 |
             ------------
 
-        The configuration of the puzzle is stored in a 2-dimensional
-        list (a list of lists) 'cells'.
+        A list of N * N integers from 0 to N * N - 1 represents an
+        N x N puzzle in the same way.
+
+        Cell i (row i // N, column i % N) is stored in bits
+        [i * bits, (i + 1) * bits) of the integer 'board' and 'blank'
+        is the index of the blank cell.
         """
-        self.cells = []
-        numbers = numbers[:] # Make a copy so as not to cause side-effects.
-        numbers.reverse()
-        for row in range( 3 ):
-            self.cells.append( [] )
-            for col in range( 3 ):
-                self.cells[row].append( numbers.pop() )
-                if self.cells[row][col] == 0:
-                    self.blankLocation = row, col
+        size = math.isqrt(len(numbers))
+        if size * size != len(numbers):
+            raise Exception('A puzzle needs N * N numbers')
+        self.size = size
+        self.bits = (size * size - 1).bit_length()
+        self.board = 0
+        for index, number in enumerate(numbers):
+            self.board |= number << (index * self.bits)
+            if number == 0:
+                self.blank = index
+
+    @property
+    def cells( self ):
+        "The configuration of the puzzle as a 2-dimensional list (a list of lists)"
+        numbers = self.numbers()
+        return [numbers[row * self.size:(row + 1) * self.size] for row in range( self.size )]
+
+    @property
+    def blankLocation( self ):
+        return divmod(self.blank, self.size)
+
+    def numbers( self ):
+        "Returns the flat list of the numbers of the puzzle, row by row"
+        mask = (1 << self.bits) - 1
+        return [(self.board >> (index * self.bits)) & mask for index in range( self.size * self.size )]
+
+    def tile( self, index ):
+        "Returns the number on cell index (row * N + col)"
+        return (self.board >> (index * self.bits)) & ((1 << self.bits) - 1)
 
     def isGoal( self ):
         """
@@ -77,13 +110,7 @@ class EightPuzzleState:
         >>> EightPuzzleState([1, 0, 2, 3, 4, 5, 6, 7, 8]).isGoal()
         False
         """
-        current = 0
-        for row in range( 3 ):
-            for col in range( 3 ):
-                if current != self.cells[row][col]:
-                    return False
-                current += 1
-        return True
+        return self.board == goalBoard(self.size)
 
     def legalMoves( self ):
         """
@@ -99,11 +126,11 @@ class EightPuzzleState:
         row, col = self.blankLocation
         if(row != 0):
             moves.append('up')
-        if(row != 2):
+        if(row != self.size - 1):
             moves.append('down')
         if(col != 0):
             moves.append('left')
-        if(col != 2):
+        if(col != self.size - 1):
             moves.append('right')
         return moves
 
@@ -119,29 +146,24 @@ class EightPuzzleState:
         NOTE: This function *does not* change the current object.  Instead,
         it returns a new object.
         """
-        row, col = self.blankLocation
         if(move == 'up'):
-            newrow = row - 1
-            newcol = col
+            newblank = self.blank - self.size
         elif(move == 'down'):
-            newrow = row + 1
-            newcol = col
+            newblank = self.blank + self.size
         elif(move == 'left'):
-            newrow = row
-            newcol = col - 1
+            newblank = self.blank - 1
         elif(move == 'right'):
-            newrow = row
-            newcol = col + 1
+            newblank = self.blank + 1
         else:
-            raise "Illegal Move"
+            raise Exception("Illegal Move")
 
         # Create a copy of the current eightPuzzle
-        newPuzzle = EightPuzzleState([0, 0, 0, 0, 0, 0, 0, 0, 0])
-        newPuzzle.cells = [values[:] for values in self.cells]
-        # And update it to reflect the move
-        newPuzzle.cells[row][col] = self.cells[newrow][newcol]
-        newPuzzle.cells[newrow][newcol] = self.cells[row][col]
-        newPuzzle.blankLocation = newrow, newcol
+        newPuzzle = EightPuzzleState.__new__(EightPuzzleState)
+        newPuzzle.size, newPuzzle.bits = self.size, self.bits
+        # And update it to reflect the move: the tile slides into the blank cell
+        tile = self.tile(newblank)
+        newPuzzle.board = self.board - (tile << (newblank * self.bits)) + (tile << (self.blank * self.bits))
+        newPuzzle.blank = newblank
 
         return newPuzzle
 
@@ -155,27 +177,25 @@ class EightPuzzleState:
               EightPuzzleState([1, 0, 2, 3, 4, 5, 6, 7, 8]).result('left')
           True
         """
-        for row in range( 3 ):
-            if self.cells[row] != other.cells[row]:
-                return False
-        return True
+        return self.size == other.size and self.board == other.board
 
     def __hash__(self):
-        return hash(str(self.cells))
+        return hash(self.board)
 
     def __getAsciiString(self):
         """
           Returns a display string for the maze
         """
+        width = len(str(self.size * self.size - 1))
         lines = []
-        horizontalLine = ('-' * (13))
+        horizontalLine = ('-' * ((width + 3) * self.size + 1))
         lines.append(horizontalLine)
         for row in self.cells:
             rowLine = '|'
             for col in row:
                 if col == 0:
                     col = ' '
-                rowLine = rowLine + ' ' + col.__str__() + ' |'
+                rowLine = rowLine + ' ' + col.__str__().rjust(width) + ' |'
             lines.append(rowLine)
             lines.append(horizontalLine)
         return '\n'.join(lines)
@@ -183,6 +203,14 @@ class EightPuzzleState:
     def __str__(self):
         return self.__getAsciiString()
 
+_GOAL_BOARDS = {}
+
+def goalBoard(size):
+    "Returns the packed board of the N x N goal configuration (cell i holds i)"
+    if size not in _GOAL_BOARDS:
+        _GOAL_BOARDS[size] = EightPuzzleState(list(range(size * size))).board
+    return _GOAL_BOARDS[size]
+
 # TODO: Implement The methods in this class
 
 class EightPuzzleSearchProblem(search.SearchProblem):
@@ -196,7 +224,7 @@ class EightPuzzleSearchProblem(search.SearchProblem):
         self.puzzle = puzzle
 
     def getStartState(self):
-        return puzzle
+        return self.puzzle
 
     def isGoalState(self,state):
         return state.isGoal()
@@ -248,20 +276,174 @@ def loadEightPuzzle(puzzleNumber):
     """
     return EightPuzzleState(EIGHT_PUZZLE_DATA[puzzleNumber])
 
-def createRandomEightPuzzle(moves=100):
+def createRandomEightPuzzle(moves=100, size=3):
     """
       moves: number of random moves to apply
+      size: the puzzle is size x size (4 for the 15-puzzle)
 
       Creates a random eight puzzle by applying
       a series of 'moves' random moves to a solved
       puzzle.
     """
-    puzzle = EightPuzzleState([0,1,2,3,4,5,6,7,8])
+    puzzle = EightPuzzleState(list(range(size * size)))
     for i in range(moves):
         # Execute a random legal move
         puzzle = puzzle.result(random.sample(puzzle.legalMoves(), 1)[0])
     return puzzle
 
+def manhattanHeuristic(state, problem=None):
+    """
+      The sum of the Manhattan distances of the tiles from their
+    goal cells, for puzzles of any size.
+    """
+    size = state.size
+    distance = 0
+    for index, number in enumerate(state.numbers()):
+        if number != 0:
+            row, col = divmod(index, size)
+            goalRow, goalCol = divmod(number, size)
+            distance += abs(row - goalRow) + abs(col - goalCol)
+    return distance
+
+# Pattern databases
+
+DEFAULT_PARTITIONS = {3: [[1, 2, 3, 4], [5, 6, 7, 8]],
+                      4: [[1, 2, 3, 4, 5], [6, 7, 8, 9, 10], [11, 12, 13, 14, 15]]}
+
+class PatternDatabase:
+    """
+      The exact number of moves of a subset of the tiles (the pattern)
+    needed to bring them to their goal cells, for every placement of
+    these tiles on the board. Moves of the other tiles are free, so the
+    databases of disjoint patterns can be added up into an admissible
+    heuristic.
+
+    The placement of the pattern tiles t_0, ..., t_{k-1} on a board of
+    C = N * N cells has the index sum(position(t_i) * C ** i), and the
+    table is a byte array with one entry per index (255 for placements
+    that cannot occur).
+    """
+    def __init__(self, size, tiles, table):
+        self.size = size
+        self.tiles = list(tiles)
+        self.table = table # bytearray, or a read-only mmap after load()
+        cells = size * size
+        self.multipliers = [cells ** i for i in range(len(self.tiles))]
+
+    @staticmethod
+    def build(size, tiles):
+        """
+          Builds the database by a retrograde breadth first search from the
+        goal over the placements of the pattern tiles and the blank. Moving
+        a pattern tile costs 1 and moving any other tile costs 0, so the
+        search is a 0-1 BFS with a deque.
+        """
+        cells = size * size
+        k = len(tiles)
+        patternStates = cells ** k
+        multipliers = [cells ** i for i in range(k)]
+        neighbours = []
+        for cell in range(cells):
+            row, col = divmod(cell, size)
+            neighbours.append([r * size + c for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1))
+                               if 0 <= r < size and 0 <= c < size])
+        # The goal has tile t on cell t and the blank on cell 0
+        start = sum(tile * multiplier for tile, multiplier in zip(tiles, multipliers))
+        cost = bytearray(b'\xff') * (patternStates * cells) # Indexed by placement + blank * patternStates
+        table = bytearray(b'\xff') * patternStates
+        cost[start] = 0
+        fringe = collections.deque([start])
+        while fringe:
+            code = fringe.popleft()
+            blank, placement = divmod(code, patternStates)
+            moves = cost[code]
+            if moves < table[placement]:
+                table[placement] = moves
+            occupied = {}
+            for i in range(k):
+                occupied[(placement // multipliers[i]) % cells] = i
+            for cell in neighbours[blank]:
+                if cell in occupied: # A pattern tile slides into the blank cell
+                    nextCode = placement + (blank - cell) * multipliers[occupied[cell]] + cell * patternStates
+                    if moves + 1 < cost[nextCode]:
+                        cost[nextCode] = moves + 1
+                        fringe.append(nextCode)
+                else:
+                    nextCode = placement + cell * patternStates
+                    if moves < cost[nextCode]:
+                        cost[nextCode] = moves
+                        fringe.appendleft(nextCode)
+        return PatternDatabase(size, tiles, table)
+
+    @staticmethod
+    def fileName(directory, size, tiles):
+        return os.path.join(directory, 'pdb_%d_%s.bin' % (size, '-'.join(map(str, tiles))))
+
+    def save(self, directory):
+        "Writes the table to a file in directory and returns the path of the file"
+        os.makedirs(directory, exist_ok=True)
+        path = PatternDatabase.fileName(directory, self.size, self.tiles)
+        with open(path, 'wb') as f:
+            f.write(self.table)
+        return path
+
+    @staticmethod
+    def load(directory, size, tiles):
+        "Memory-maps a table saved by save(). Returns None if there is no such file."
+        path = PatternDatabase.fileName(directory, size, tiles)
+        if not os.path.exists(path) or os.path.getsize(path) != (size * size) ** len(tiles):
+            return None
+        with open(path, 'rb') as f:
+            table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return PatternDatabase(size, tiles, table)
+
+    def lookup(self, positions):
+        "positions[t] is the cell of tile t"
+        index = 0
+        for tile, multiplier in zip(self.tiles, self.multipliers):
+            index += positions[tile] * multiplier
+        return self.table[index]
+
+class PatternDatabaseHeuristic:
+    """
+      A disjoint additive pattern database heuristic for A* on N x N
+    puzzles. The databases of the partition are loaded from directory
+    when they have been saved there before and built (and saved, if a
+    directory is given) otherwise.
+
+    >>> heuristic = PatternDatabaseHeuristic(3)
+    >>> heuristic(EightPuzzleState([1, 0, 2, 3, 4, 5, 6, 7, 8]))
+    1
+    """
+    def __init__(self, size, partition=None, directory=None):
+        self.size = size
+        self.databases = []
+        for tiles in (partition or DEFAULT_PARTITIONS[size]):
+            database = PatternDatabase.load(directory, size, tiles) if directory else None
+            if database is None:
+                database = PatternDatabase.build(size, tiles)
+                if directory:
+                    database.save(directory)
+            self.databases.append(database)
+
+    def __call__(self, state, problem=None):
+        positions = [0] * (self.size * self.size)
+        for index, number in enumerate(state.numbers()):
+            positions[number] = index
+        return sum(database.lookup(positions) for database in self.databases)
+
+_PATTERN_DATABASE_HEURISTICS = {}
+
+def patternDatabaseHeuristic(state, problem=None):
+    """
+      The additive pattern database heuristic with the default partition
+    for the size of the puzzle. The databases are built in memory the first
+    time a size is used.
+    """
+    if state.size not in _PATTERN_DATABASE_HEURISTICS:
+        _PATTERN_DATABASE_HEURISTICS[state.size] = PatternDatabaseHeuristic(state.size)
+    return _PATTERN_DATABASE_HEURISTICS[state.size](state, problem)
+
 if __name__ == '__main__':
     puzzle = createRandomEightPuzzle(25)
     print('A random puzzle:')
@@ -274,11 +274,174 @@ class Grid:
                 bools.append(False)
         return bools
 
+class BitGrid:
+    """
+    A 2-dimensional array of booleans packed into the bits of a single int,
+    with the same interface as Grid.  Cell (x,y) is bit x * height + y, so a
+    copy only copies a reference, count is a popcount and asList visits the
+    set bits only.
+
+    Cells are read and written via grid[x][y] as with a Grid: grid[x] returns
+    a view of column x that reads and writes the bits of the grid.  A read
+    through the view is slower than a list lookup, so BitGrid suits grids
+    that are copied, counted and listed often, like the food, rather than
+    the walls.
+    """
+    CELLS_PER_INT = 30
+
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+
+        self.width = width
+        self.height = height
+        self.bits = (1 << (width * height)) - 1 if initialValue else 0
+        if bitRepresentation:
+            self._unpackBits(bitRepresentation)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.width
+        if not 0 <= i < self.width:
+            raise IndexError('grid index out of range')
+        return BitGridColumn(self, i)
+
+    def __setitem__(self, key, item):
+        column = self[key]
+        for y, value in enumerate(item):
+            column[y] = value
+
+    def __len__(self):
+        return self.width
+
+    def __str__(self):
+        out = [[str(self[x][y])[0] for x in range(self.width)]
+               for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.height == other.height
+        if isinstance(other, Grid):
+            return self.data == other.data
+        return False
+
+    def __hash__(self):
+        # Equal to the hash of a Grid with the same cells
+        return hash(self.bits)
+
+    @property
+    def data(self):
+        "The cells as a list of columns, like the data of a Grid"
+        return [list(column) for column in self]
+
+    def copy(self):
+        g = BitGrid(self.width, self.height)
+        g.bits = self.bits
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        # An int cannot be shared for writing, and copying it is free anyway
+        return self.copy()
+
+    def withCell(self, x, y, value):
+        "Returns a copy of the grid with the cell (x, y) set to value"
+        g = self.copy()
+        g[x][y] = value
+        return g
+
+    def count(self, item=True):
+        ones = bin(self.bits).count('1')
+        if item:
+            return ones
+        return self.width * self.height - ones
+
+    def asList(self, key=True):
+        bits = self.bits
+        if not key:
+            bits = ~bits & ((1 << (self.width * self.height)) - 1)
+        list = []
+        while bits:
+            lowest = bits & -bits
+            list.append(divmod(lowest.bit_length() - 1, self.height))
+            bits ^= lowest
+        return list
+
+    def packBits(self):
+        """
+        Returns the same int list representation as Grid.packBits
+
+        (width, height, bitPackedInts...)
+
+        Each packed int holds the next CELLS_PER_INT cells, the first one in
+        its most significant bit, so the cells are reversed once as a string
+        of binary digits and cut into slices.
+        """
+        cells = self.width * self.height
+        digits = format(self.bits, '0%db' % cells)[::-1]
+        size = (cells // self.CELLS_PER_INT + 1) * self.CELLS_PER_INT
+        digits = digits.ljust(size, '0')
+        bits = [self.width, self.height]
+        for i in range(0, size, self.CELLS_PER_INT):
+            bits.append(int(digits[i:i + self.CELLS_PER_INT], 2))
+        return tuple(bits)
+
+    def _unpackBits(self, bits):
+        """
+        Fills in data from a bit-level representation
+        """
+        if any(packed < 0 for packed in bits):
+            raise ValueError("must be a positive integer")
+        cells = self.width * self.height
+        digits = ''.join([format(packed, '0%db' % self.CELLS_PER_INT)[-self.CELLS_PER_INT:]
+                          for packed in bits])[:cells]
+        if digits:
+            # Cells missing from the representation keep their initial value
+            kept = self.bits >> len(digits) << len(digits)
+            self.bits = kept | int(digits[::-1], 2)
+
+class BitGridColumn:
+    """
+    The column x of a BitGrid, read and written as grid[x][y].
+    """
+    __slots__ = ('grid', 'offset')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+
+    def _bit(self, y):
+        if y < 0:
+            y += self.grid.height
+        if not 0 <= y < self.grid.height:
+            raise IndexError('grid index out of range')
+        return 1 << (self.offset + y)
+
+    def __getitem__(self, y):
+        return self.grid.bits & self._bit(y) != 0
+
+    def __setitem__(self, y, value):
+        if value:
+            self.grid.bits |= self._bit(y)
+        else:
+            self.grid.bits &= ~self._bit(y)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        bits = self.grid.bits >> self.offset
+        for y in range(self.grid.height):
+            yield bits >> y & 1 == 1
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
     width, height = bitRep[:2]
-    return Grid(width, height, bitRepresentation= bitRep[2:])
+    return BitGrid(width, height, bitRepresentation= bitRep[2:])
 
 ####################################
 # Parts you shouldn't have to read #
@@ -329,8 +492,18 @@ class Actions:
         return (dx * speed, dy * speed)
     directionToVector = staticmethod(directionToVector)
 
+    def getLegalMoves(walls):
+        """
+        Returns the LegalMoves table of a walls grid. It is built the first
+        time it is needed (by Layout, on load) and kept with the grid.
+        """
+        moves = getattr(walls, 'legalMoves', None)
+        if moves is None:
+            moves = walls.legalMoves = LegalMoves(walls)
+        return moves
+    getLegalMoves = staticmethod(getLegalMoves)
+
     def getPossibleActions(config, walls):
-        possible = []
         x, y = config.pos
         x_int, y_int = int(x + 0.5), int(y + 0.5)
 
@@ -338,28 +511,16 @@ class Actions:
         if (abs(x - x_int) + abs(y - y_int)  > Actions.TOLERANCE):
             return [config.getDirection()]
 
-        for dir, vec in Actions._directionsAsList:
-            dx, dy = vec
-            next_y = y_int + dy
-            next_x = x_int + dx
-            if not walls[next_x][next_y]: possible.append(dir)
-
-        return possible
+        moves = Actions.getLegalMoves(walls)
+        return list(moves.actions[x_int * moves.height + y_int])
 
     getPossibleActions = staticmethod(getPossibleActions)
 
     def getLegalNeighbors(position, walls):
         x,y = position
         x_int, y_int = int(x + 0.5), int(y + 0.5)
-        neighbors = []
-        for dir, vec in Actions._directionsAsList:
-            dx, dy = vec
-            next_x = x_int + dx
-            if next_x < 0 or next_x == walls.width: continue
-            next_y = y_int + dy
-            if next_y < 0 or next_y == walls.height: continue
-            if not walls[next_x][next_y]: neighbors.append((next_x, next_y))
-        return neighbors
+        moves = Actions.getLegalMoves(walls)
+        return list(moves.neighbors[x_int * moves.height + y_int])
     getLegalNeighbors = staticmethod(getLegalNeighbors)
 
     def getSuccessor(position, action):
@@ -368,6 +529,39 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
+class LegalMoves:
+    """
+    The legal moves from every cell of a walls grid, computed once so that
+    Actions and the search problems answer with a single lookup.  The cell
+    (x,y) has the id x * height + y, like its bit in a BitGrid.
+
+    actions[id]     the directions allowed from the cell, Stop included, in
+                    the order of Actions._directionsAsList
+    neighbors[id]   the cells these directions lead to
+    successors[id]  the (cell, direction) pairs of the moves to the other
+                    cells, in the North, South, East, West order in which
+                    the search problems generate their successors
+    """
+    SEARCH_ORDER = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+
+    def __init__(self, walls):
+        self.height = walls.height
+        self.actions = []
+        self.neighbors = []
+        self.successors = []
+        for x in range(walls.width):
+            for y in range(walls.height):
+                moves = {}
+                for direction, (dx, dy) in Actions._directionsAsList:
+                    next_x, next_y = x + dx, y + dy
+                    if 0 <= next_x < walls.width and 0 <= next_y < walls.height \
+                            and not walls[next_x][next_y]:
+                        moves[direction] = (next_x, next_y)
+                self.actions.append(tuple(moves))
+                self.neighbors.append(tuple(moves.values()))
+                self.successors.append(tuple([(moves[direction], direction)
+                                              for direction in self.SEARCH_ORDER if direction in moves]))
+
 class GameStateData:
     """
 
@@ -587,11 +781,11 @@ class Game:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = TimeoutFunction(agent.registerInitialState, self.rules.getMaxStartupTime(i))
                         try:
-                            start_time = time.time()
+                            start_time = time.perf_counter()
                             timed_func(self.state.deepCopy())
-                            time_taken = time.time() - start_time
+                            time_taken = time.perf_counter() - start_time
                             self.totalAgentTimes[i] += time_taken
                         except TimeoutFunctionException:
                             print("Agent %d ran out of time on startup!" % i, file=sys.stderr)
@@ -621,13 +815,13 @@ class Game:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(agent.observationFunction, self.rules.getMoveTimeout(agentIndex))
                         try:
-                            start_time = time.time()
+                            start_time = time.perf_counter()
                             observation = timed_func(self.state.deepCopy())
                         except TimeoutFunctionException:
                             skip_action = True
-                        move_time += time.time() - start_time
+                        move_time += time.perf_counter() - start_time
                         self.unmute()
                     except Exception as data:
                         self._agentCrash(agentIndex, quiet=False)
@@ -644,9 +838,9 @@ class Game:
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = TimeoutFunction(agent.getAction, self.rules.getMoveTimeout(agentIndex) - move_time)
                     try:
-                        start_time = time.time()
+                        start_time = time.perf_counter()
                         if skip_action:
                             raise TimeoutFunctionException()
                         action = timed_func( observation )
@@ -657,7 +851,7 @@ class Game:
                         self.unmute()
                         return
 
-                    move_time += time.time() - start_time
+                    move_time += time.perf_counter() - start_time
 
                     if move_time > self.rules.getMoveWarningTime(agentIndex):
                         self.totalAgentTimeWarnings[agentIndex] += 1
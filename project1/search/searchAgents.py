@@ -124,6 +124,9 @@ class SearchAgent(Agent):
         totalCost = problem.getCostOfActions(self.actions)
         print('Path found with total cost of %d in %.1f seconds' % (totalCost, time.time() - starttime))
         if '_expanded' in dir(problem): print('Search nodes expanded: %d' % problem._expanded)
+        if 'heuristicInfo' in dir(problem) and 'mazeDistances' in problem.heuristicInfo:
+            oracle = problem.heuristicInfo['mazeDistances']
+            print('Maze distances: %d rows built in %.3f seconds' % (len(oracle.rows), oracle.buildTime))
 
     def getAction(self, state):
         """
@@ -161,6 +164,7 @@ class PositionSearchProblem(search.SearchProblem):
         goal: A position in the gameState
         """
         self.walls = gameState.getWalls()
+        self.legalMoves = Actions.getLegalMoves(self.walls)
         self.startState = gameState.getPacmanPosition()
         if start != None: self.startState = start
         self.goal = goal
@@ -201,14 +205,11 @@ class PositionSearchProblem(search.SearchProblem):
         """
 
         successors = []
-        for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            x,y = state
-            dx, dy = Actions.directionToVector(action)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]:
-                nextState = (nextx, nexty)
-                cost = self.costFn(nextState)
-                successors.append( ( nextState, action, cost) )
+        x,y = state
+        # The legal moves, North, South, East and West, come from the table of the walls
+        for nextState, action in self.legalMoves.successors[x * self.legalMoves.height + y]:
+            cost = self.costFn(nextState)
+            successors.append( ( nextState, action, cost) )
 
         # Bookkeeping for display purposes
         self._expanded += 1 # DO NOT CHANGE
@@ -286,6 +287,7 @@ class CornersProblem(search.SearchProblem):
         Stores the walls, pacman's starting position and corners.
         """
         self.walls = startingGameState.getWalls()
+        self.legalMoves = Actions.getLegalMoves(self.walls)
         self.startingPosition = startingGameState.getPacmanPosition()
         top, right = self.walls.height-2, self.walls.width-2
         self.corners = ((1,1), (1,top), (right, 1), (right, top))
@@ -298,6 +300,10 @@ class CornersProblem(search.SearchProblem):
         "*** YOUR CODE HERE ***"
         
         self.costFn = lambda x: 1
+        # A state is ( position, visitedMask ) where bit i of visitedMask is set
+        # if self.corners[i] has been visited
+        self.cornerBits = dict([(corner, 1 << i) for i, corner in enumerate(self.corners)])
+        self.allCornersVisited = (1 << len(self.corners)) - 1
         
     def getStartState(self):
         """
@@ -305,10 +311,8 @@ class CornersProblem(search.SearchProblem):
         space)
         """
         "*** YOUR CODE HERE ***"
-        starting_visited_corners = []
         point = self.startingPosition
-        if point in self.corners:
-            starting_visited_corners.append(point)
+        starting_visited_corners = self.cornerBits.get(point, 0)
         return point, starting_visited_corners
         util.raiseNotDefined()
 
@@ -317,13 +321,8 @@ class CornersProblem(search.SearchProblem):
         Returns whether this search state is a goal state of the problem.
         """
         "*** YOUR CODE HERE ***"
-        point = state[0] # The coordinates of current point state
-        visited_corners = state[1] # List of visited corners
-        if point in self.corners:
-            if not point in visited_corners:
-                visited_corners.append(point)
-            return len(visited_corners) == 4 # Have we visited all corners?
-        return False
+        visited_corners = state[1] # Mask of visited corners
+        return visited_corners == self.allCornersVisited # Have we visited all corners?
         util.raiseNotDefined()
 
     def getSuccessors(self, state: Any):
@@ -338,27 +337,22 @@ class CornersProblem(search.SearchProblem):
         """
 
         successors = []
-        for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            # Add a successor state to the successor list if the action is legal
-            # Here's a code snippet for figuring out whether a new position hits a wall:
-            #   x,y = currentPosition
-            #   dx, dy = Actions.directionToVector(action)
-            #   nextx, nexty = int(x + dx), int(y + dy)
-            #   hitsWall = self.walls[nextx][nexty]
-
-            "*** YOUR CODE HERE ***"
-            x,y = state[0] # Point coordinates
-            visited_corners = state[1] # List of visited corners
-            dx, dy = Actions.directionToVector(action)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]: # If not wall
-                successors_visited_corners = list(visited_corners) # Successor's visited corner list
-                nextState = (nextx, nexty) # Point of nextState
-                """Check if nextState is corner and update"""
-                if nextState in self.corners and nextState not in visited_corners:
-                    successors_visited_corners.append(nextState)
-                cost = self.costFn(nextState)
-                successors.append(((nextState, successors_visited_corners), action, cost))
+        # Add a successor state to the successor list if the action is legal
+        # Here's a code snippet for figuring out whether a new position hits a wall:
+        #   x,y = currentPosition
+        #   dx, dy = Actions.directionToVector(action)
+        #   nextx, nexty = int(x + dx), int(y + dy)
+        #   hitsWall = self.walls[nextx][nexty]
+
+        "*** YOUR CODE HERE ***"
+        x,y = state[0] # Point coordinates
+        visited_corners = state[1] # Mask of visited corners
+        # The legal moves (North, South, East, West) come from the table of the walls
+        for nextState, action in self.legalMoves.successors[x * self.legalMoves.height + y]:
+            """Check if nextState is corner and update"""
+            successors_visited_corners = visited_corners | self.cornerBits.get(nextState, 0)
+            cost = self.costFn(nextState)
+            successors.append(((nextState, successors_visited_corners), action, cost))
 
         self._expanded += 1 # DO NOT CHANGE
         return successors
@@ -395,11 +389,11 @@ def cornersHeuristic(state: Any, problem: CornersProblem):
 
     "*** YOUR CODE HERE ***"
     current_point = state[0] # Coordinates of pacman's current state
-    visited_corners = state[1] # The corners that pacman has visited
+    visited_corners = state[1] # Mask of the corners that pacman has visited
     total_cost = 0
     left_to_visit = [] # Which corners are left to visit
     for corner in corners:
-        if not corner in visited_corners:
+        if not visited_corners & problem.cornerBits[corner]:
             left_to_visit.append(corner)
     while left_to_visit:
         """ Get the manhattan distance of the whole path cost 
@@ -429,6 +423,7 @@ class FoodSearchProblem:
     def __init__(self, startingGameState: pacman.GameState):
         self.start = (startingGameState.getPacmanPosition(), startingGameState.getFood())
         self.walls = startingGameState.getWalls()
+        self.legalMoves = Actions.getLegalMoves(self.walls)
         self.startingGameState = startingGameState
         self._expanded = 0 # DO NOT CHANGE
         self.heuristicInfo = {} # A dictionary for the heuristic to store information
@@ -443,14 +438,11 @@ class FoodSearchProblem:
         "Returns successor states, the actions they require, and a cost of 1."
         successors = []
         self._expanded += 1 # DO NOT CHANGE
-        for direction in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            x,y = state[0]
-            dx, dy = Actions.directionToVector(direction)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]:
-                nextFood = state[1].copy()
-                nextFood[nextx][nexty] = False
-                successors.append( ( ((nextx, nexty), nextFood), direction, 1) )
+        x,y = state[0]
+        for (nextx, nexty), direction in self.legalMoves.successors[x * self.legalMoves.height + y]:
+            nextFood = state[1].copy()
+            nextFood[nextx][nexty] = False
+            successors.append( ( ((nextx, nexty), nextFood), direction, 1) )
         return successors
 
     def getCostOfActions(self, actions):
@@ -467,11 +459,47 @@ class FoodSearchProblem:
             cost += 1
         return cost
 
+class BitmaskFoodSearchProblem(FoodSearchProblem):
+    """
+    The FoodSearchProblem with a compact state space. A search state is a
+    tuple ( pacmanPosition, foodMask ) where foodMask is an int with bit i set
+    if the i-th food cell of the starting layout (self.foodCells[i]) still has
+    food. Successors, the goal test and hashing are integer operations
+    instead of Grid copies, counts and hashes.
+    """
+    def __init__(self, startingGameState: pacman.GameState):
+        FoodSearchProblem.__init__(self, startingGameState)
+        self.foodCells = self.start[1].asList() # Index table: bit -> food position
+        self.foodBits = dict([(cell, 1 << i) for i, cell in enumerate(self.foodCells)])
+        self.start = (self.start[0], (1 << len(self.foodCells)) - 1)
+
+    def isGoalState(self, state):
+        return state[1] == 0
+
+    def getSuccessors(self, state):
+        "Returns successor states, the actions they require, and a cost of 1."
+        successors = []
+        self._expanded += 1 # DO NOT CHANGE
+        x,y = state[0]
+        for nextState, direction in self.legalMoves.successors[x * self.legalMoves.height + y]:
+            nextFood = state[1] & ~self.foodBits.get(nextState, 0)
+            successors.append( ( (nextState, nextFood), direction, 1) )
+        return successors
+
+    def foodAsList(self, foodMask):
+        "Returns the positions of the food left in foodMask"
+        food = []
+        while foodMask:
+            lowest = foodMask & -foodMask
+            food.append(self.foodCells[lowest.bit_length() - 1])
+            foodMask ^= lowest
+        return food
+
 class AStarFoodSearchAgent(SearchAgent):
     "A SearchAgent for FoodSearchProblem using A* and your foodHeuristic"
     def __init__(self):
         self.searchFunction = lambda prob: search.aStarSearch(prob, foodHeuristic)
-        self.searchType = FoodSearchProblem
+        self.searchType = BitmaskFoodSearchProblem
 
 import itertools
 
@@ -505,12 +533,17 @@ def foodHeuristic(state: Tuple[Tuple, List[List]], problem: FoodSearchProblem):
     """
     position, foodGrid = state
     "*** YOUR CODE HERE ***"
-    food_left = foodGrid.asList()
-    gameState = problem.startingGameState
+    if isinstance(foodGrid, int): # The foodMask of a BitmaskFoodSearchProblem
+        food_left = problem.foodAsList(foodGrid)
+    else:
+        food_left = foodGrid.asList()
+    if 'mazeDistances' not in problem.heuristicInfo: # Build the distance oracle once per layout
+        problem.heuristicInfo['mazeDistances'] = MazeDistanceOracle(problem.walls)
+    distances = problem.heuristicInfo['mazeDistances']
     if position in food_left:
         food_left.remove(position)
     if food_left:
-        d = max([mazeDistance(position,point,gameState) for point in food_left])
+        d = max([distances.distance(position,point) for point in food_left])
         return d
     else: 
         return 0
@@ -569,6 +602,7 @@ class AnyFoodSearchProblem(PositionSearchProblem):
 
         # Store info for the PositionSearchProblem (no need to change this)
         self.walls = gameState.getWalls()
+        self.legalMoves = Actions.getLegalMoves(self.walls)
         self.startState = gameState.getPacmanPosition()
         self.costFn = lambda x: 1
         self._visited, self._visitedlist, self._expanded = {}, [], 0 # DO NOT CHANGE
@@ -601,3 +635,58 @@ def mazeDistance(point1: Tuple[int, int], point2: Tuple[int, int], gameState: pa
     assert not walls[x2][y2], 'point2 is a wall: ' + str(point2)
     prob = PositionSearchProblem(gameState, start=point1, goal=point2, warn=False, visualize=False)
     return len(search.bfs(prob))
+
+
+class MazeDistanceOracle:
+    """
+    Maze distances between the open cells of a layout, computed from its
+    walls Grid. The distances from a source cell to every cell are found
+    with a single BFS the first time the source is queried and are stored
+    as a row of a flat array indexed by x * height + y, so that every other
+    query from (or, since distances are symmetric, to) that cell is an O(1)
+    lookup. The time spent in BFS is kept in buildTime.
+    """
+    def __init__(self, walls):
+        self.walls = walls
+        self.width, self.height = walls.width, walls.height
+        self.rows = {} # source cell index -> array of distances (-1 if unreachable)
+        self.buildTime = 0.0
+
+    def distance(self, point1: Tuple[int, int], point2: Tuple[int, int]) -> int:
+        """
+        Returns the maze distance between point1 and point2. The row of
+        point2 is preferred, so a fixed set of targets (e.g. the food) is
+        answered from a few cached rows.
+        """
+        index1 = point1[0] * self.height + point1[1]
+        index2 = point2[0] * self.height + point2[1]
+        if index2 in self.rows:
+            return self.rows[index2][index1]
+        if index1 in self.rows:
+            return self.rows[index1][index2]
+        return self._row(point2)[index1]
+
+    def _row(self, source: Tuple[int, int]):
+        "Runs a BFS from source over the open cells and caches the distances"
+        from array import array
+        starttime = time.time()
+        height, walls = self.height, self.walls
+        assert not walls[source[0]][source[1]], 'point is a wall: ' + str(source)
+        row = array('l', [-1]) * (self.width * height)
+        start = source[0] * height + source[1]
+        row[start] = 0
+        frontier = [source]
+        d = 0
+        while frontier:
+            d += 1
+            nextFrontier = []
+            for x, y in frontier:
+                for nextx, nexty in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)):
+                    index = nextx * height + nexty
+                    if row[index] == -1 and not walls[nextx][nexty]:
+                        row[index] = d
+                        nextFrontier.append((nextx, nexty))
+            frontier = nextFrontier
+        self.rows[start] = row
+        self.buildTime += time.time() - starttime
+        return row
@@ -173,19 +173,39 @@ class PriorityQueue:
       has a priority associated with it and the client is usually interested
       in quick retrieval of the lowest-priority item in the queue. This
       data structure allows O(1) access to the lowest-priority item.
+
+      The heap is an indexed binary heap: every entry is a list
+      [priority, count, item, position] and a position map from each item
+      to its entries on the heap makes update (decrease-key) O(log n).
+      Items with equal priority are popped in FIFO order.
     """
     def  __init__(self):
         self.heap = []
         self.count = 0
+        self.entries = {} # item -> list of its entries on the heap
 
     def push(self, item, priority):
-        entry = (priority, self.count, item)
-        heapq.heappush(self.heap, entry)
+        entry = [priority, self.count, item, len(self.heap)]
+        self.heap.append(entry)
         self.count += 1
+        try:
+            self.entries.setdefault(item, []).append(entry)
+        except TypeError:
+            pass # Unhashable items are not indexed
+        self._siftUp(entry[3])
 
     def pop(self):
-        (_, _, item) = heapq.heappop(self.heap)
-        return item
+        heap = self.heap
+        last = heap.pop()
+        if heap:
+            entry = heap[0]
+            last[3] = 0
+            heap[0] = last
+            self._siftDown(0)
+        else:
+            entry = last
+        self._unindex(entry)
+        return entry[2]
 
     def isEmpty(self):
         return len(self.heap) == 0
@@ -194,16 +214,61 @@ class PriorityQueue:
         # If item already in priority queue with higher priority, update its priority and rebuild the heap.
         # If item already in priority queue with equal or lower priority, do nothing.
         # If item not in priority queue, do the same thing as self.push.
-        for index, (p, c, i) in enumerate(self.heap):
-            if i == item:
-                if p <= priority:
-                    break
-                del self.heap[index]
-                self.heap.append((priority, c, item))
-                heapq.heapify(self.heap)
-                break
-        else:
+        try:
+            entries = self.entries.get(item)
+        except TypeError: # Unhashable item, fall back to a linear scan
+            entries = [entry for entry in self.heap if entry[2] == item]
+        if not entries:
             self.push(item, priority)
+            return
+        entry = min(entries)
+        if entry[0] <= priority:
+            return
+        entry[0] = priority
+        self._siftUp(entry[3])
+
+    def _unindex(self, entry):
+        try:
+            entries = self.entries[entry[2]]
+        except (KeyError, TypeError):
+            return
+        entries.remove(entry)
+        if not entries:
+            del self.entries[entry[2]]
+
+    def _siftUp(self, pos):
+        heap = self.heap
+        entry = heap[pos]
+        while pos > 0:
+            parentpos = (pos - 1) >> 1
+            parent = heap[parentpos]
+            if entry < parent:
+                parent[3] = pos
+                heap[pos] = parent
+                pos = parentpos
+                continue
+            break
+        entry[3] = pos
+        heap[pos] = entry
+
+    def _siftDown(self, pos):
+        heap = self.heap
+        size = len(heap)
+        entry = heap[pos]
+        childpos = 2 * pos + 1
+        while childpos < size:
+            rightpos = childpos + 1
+            if rightpos < size and heap[rightpos] < heap[childpos]:
+                childpos = rightpos
+            child = heap[childpos]
+            if not child < entry:
+                break
+            child[3] = pos
+            heap[pos] = child
+            pos = childpos
+            childpos = 2 * pos + 1
+        entry[3] = pos
+        heap[pos] = entry
 
 class PriorityQueueWithFunction(PriorityQueue):
     """
@@ -599,20 +664,31 @@ def pause():
 
 # code to handle timeouts
 #
-# FIXME
-# NOTE: TimeoutFuncton is NOT reentrant.  Later timeouts will silently
-# disable earlier timeouts.  Could be solved by maintaining a global list
-# of active time outs.  Currently, questions which have test cases calling
-# this have all student code so wrapped.
+# TimeoutFunction calls are reentrant: the deadlines of all the active calls
+# are kept, and the timer is always armed for the earliest one.
 #
 import signal
 import time
+import threading
+
+
 class TimeoutFunctionException(Exception):
     """Exception to raise on a timeout"""
     pass
 
 
 class TimeoutFunction:
+    """
+    Calls function and raises TimeoutFunctionException if it runs for more
+    than timeout seconds.  The timeout can be a float; it is enforced with
+    millisecond resolution.
+
+    In the main thread, a SIGALRM interval timer interrupts the function.  In
+    other threads, e.g. those of a thread pool running games, a watchdog
+    thread raises the exception in the thread of the function.  Where neither
+    is available, the time taken is checked after the function has returned.
+    """
+
     def __init__(self, function, timeout):
         self.timeout = timeout
         self.function = function
@@ -621,25 +697,155 @@ class TimeoutFunction:
         raise TimeoutFunctionException()
 
     def __call__(self, *args, **keyArgs):
-        # If we have SIGALRM signal, use it to cause an exception if and
-        # when this function runs too long.  Otherwise check the time taken
-        # after the method has returned, and throw an exception then.
-        if hasattr(signal, 'SIGALRM'):
-            old = signal.signal(signal.SIGALRM, self.handle_timeout)
-            signal.alarm(self.timeout)
-            try:
-                result = self.function(*args, **keyArgs)
-            finally:
-                signal.signal(signal.SIGALRM, old)
-            signal.alarm(0)
+        if self.timeout <= 0:
+            self.handle_timeout(None, None)
+        deadline = time.perf_counter() + self.timeout
+        if hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread():
+            timer = _ALARM_TIMER
+        elif _WATCHDOG.available:
+            timer = _WATCHDOG
         else:
-            startTime = time.time()
             result = self.function(*args, **keyArgs)
-            timeElapsed = time.time() - startTime
-            if timeElapsed >= self.timeout:
+            if time.perf_counter() >= deadline:
                 self.handle_timeout(None, None)
-        return result
+            return result
+        handle = timer.start(deadline)
+        try:
+            return self.function(*args, **keyArgs)
+        finally:
+            timer.stop(handle)
+
 
+class AlarmTimer:
+    """
+    Interrupts the main thread with SIGALRM when the earliest deadline of the
+    active TimeoutFunction calls has passed.  Each call costs two setitimer
+    system calls; the signal handler is installed while there are deadlines,
+    and the previous handler is restored once there are none.
+    """
+
+    def __init__(self):
+        self.deadlines = []
+        self.previousHandler = None
+
+    def start(self, deadline):
+        if not self.deadlines:
+            self.previousHandler = signal.signal(signal.SIGALRM, self.handle_alarm)
+        self.deadlines.append(deadline)
+        self.arm()
+        return deadline
+
+    def stop(self, deadline):
+        self.deadlines.remove(deadline)
+        self.arm()
+        if not self.deadlines:
+            previous = self.previousHandler
+            self.previousHandler = None
+            # A handler installed outside Python is reported as None
+            signal.signal(signal.SIGALRM, signal.SIG_DFL if previous is None else previous)
+
+    def arm(self):
+        if self.deadlines:
+            remaining = min(self.deadlines) - time.perf_counter()
+            signal.setitimer(signal.ITIMER_REAL, max(remaining, 0.0001))
+        else:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    def handle_alarm(self, signum, frame):
+        if self.deadlines and min(self.deadlines) <= time.perf_counter():
+            raise TimeoutFunctionException()
+        self.arm()
+
+
+class WatchdogDeadline:
+    """
+    The deadline of a TimeoutFunction call in a thread, which is either
+    cancelled by the call or fired by the watchdog, whichever comes first.
+    """
+    PENDING, CANCELLED, FIRED = range(3)
+
+    def __init__(self, deadline, threadId):
+        self.deadline = deadline
+        self.threadId = threadId
+        self.state = WatchdogDeadline.PENDING
+        self.lock = threading.Lock()  # Guards state, never held while raising
+        self.raised = threading.Lock()  # Released once the exception is raised
+        self.raised.acquire()
+
+    def __lt__(self, other):
+        return self.deadline < other.deadline
+
+
+class WatchdogTimer:
+    """
+    A daemon thread that raises TimeoutFunctionException in the threads whose
+    TimeoutFunction calls passed their deadline.  The exception is raised
+    with PyThreadState_SetAsyncExc, so it interrupts Python code only.
+
+    The exception can be delivered anywhere in the thread, so the watchdog
+    raises it without holding any lock, and the thread never holds a lock
+    the watchdog needs when it may be delivered.
+    """
+
+    def __init__(self):
+        try:
+            import ctypes
+            self.setAsyncExc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+            self.available = True
+        except (ImportError, AttributeError):
+            self.available = False
+        self.condition = threading.Condition()  # Guards timers
+        self.timers = []  # Heap of WatchdogDeadline
+        self.thread = None
+
+    def start(self, deadline):
+        timer = WatchdogDeadline(deadline, threading.get_ident())
+        with self.condition:
+            heapq.heappush(self.timers, timer)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='TimeoutFunction watchdog')
+                self.thread.daemon = True
+                self.thread.start()
+            if self.timers[0] is timer:
+                self.condition.notify()
+        return timer
+
+    def stop(self, timer):
+        import ctypes
+        with timer.lock:
+            if timer.state == WatchdogDeadline.PENDING:
+                timer.state = WatchdogDeadline.CANCELLED  # Removed from the heap when it reaches the top
+                return
+        # The watchdog fired first: once it has raised the exception, take it
+        # back if it has not been delivered yet
+        timer.raised.acquire()
+        self.setAsyncExc(ctypes.c_ulong(timer.threadId), None)
+
+    def run(self):
+        import ctypes
+        while True:
+            with self.condition:
+                while self.timers and self.timers[0].state != WatchdogDeadline.PENDING:
+                    heapq.heappop(self.timers)
+                if not self.timers:
+                    self.condition.wait()
+                    continue
+                remaining = self.timers[0].deadline - time.perf_counter()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                timer = heapq.heappop(self.timers)
+            with timer.lock:
+                if timer.state != WatchdogDeadline.PENDING:
+                    continue
+                timer.state = WatchdogDeadline.FIRED
+            self.setAsyncExc(ctypes.c_ulong(timer.threadId),
+                             ctypes.py_object(TimeoutFunctionException))
+            timer.raised.release()
+
+
+_ALARM_TIMER = AlarmTimer()
+_WATCHDOG = WatchdogTimer()
 
 
 _ORIGINAL_STDOUT = None
@@ -25,6 +25,7 @@ import time
 import os
 import traceback
 import sys
+import hashlib
 
 #######################
 # Parts worth reading #
@@ -231,6 +232,18 @@ class Grid:
         g.data = self.data
         return g
 
+    def withCell(self, x, y, value):
+        """
+        Returns a copy of the grid with the cell (x, y) set to value. Only
+        column x is copied, the other columns are shared with this grid.
+        """
+        g = Grid(0, self.height)
+        g.width = self.width
+        g.data = self.data[:]
+        g.data[x] = g.data[x][:]
+        g.data[x][y] = value
+        return g
+
     def count(self, item=True):
         return sum([x.count(item) for x in self.data])
 
@@ -262,7 +275,7 @@ class Grid:
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
@@ -293,16 +306,206 @@ class Grid:
         return bools
 
 
+class BitGrid:
+    """
+    A 2-dimensional array of booleans packed into the bits of a single int,
+    with the same interface as Grid.  Cell (x,y) is bit x * height + y, so a
+    copy only copies a reference, count is a popcount and asList visits the
+    set bits only.
+
+    Cells are read and written via grid[x][y] as with a Grid: grid[x] returns
+    a view of column x that reads and writes the bits of the grid.  A read
+    through the view is slower than a list lookup, so BitGrid suits grids
+    that are copied, counted and listed often, like the food, rather than
+    the walls.
+    """
+    CELLS_PER_INT = 30
+
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+        if initialValue not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+
+        self.width = width
+        self.height = height
+        self.bits = (1 << (width * height)) - 1 if initialValue else 0
+        if bitRepresentation:
+            self._unpackBits(bitRepresentation)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.width
+        if not 0 <= i < self.width:
+            raise IndexError('grid index out of range')
+        return BitGridColumn(self, i)
+
+    def __setitem__(self, key, item):
+        column = self[key]
+        for y, value in enumerate(item):
+            column[y] = value
+
+    def __len__(self):
+        return self.width
+
+    def __str__(self):
+        out = [[str(self[x][y])[0] for x in range(self.width)]
+               for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.height == other.height
+        if isinstance(other, Grid):
+            return self.data == other.data
+        return False
+
+    def __hash__(self):
+        # Equal to the hash of a Grid with the same cells
+        return hash(self.bits)
+
+    @property
+    def data(self):
+        "The cells as a list of columns, like the data of a Grid"
+        return [list(column) for column in self]
+
+    def copy(self):
+        g = BitGrid(self.width, self.height)
+        g.bits = self.bits
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        # An int cannot be shared for writing, and copying it is free anyway
+        return self.copy()
+
+    def withCell(self, x, y, value):
+        "Returns a copy of the grid with the cell (x, y) set to value"
+        g = self.copy()
+        g[x][y] = value
+        return g
+
+    def count(self, item=True):
+        ones = bin(self.bits).count('1')
+        if item:
+            return ones
+        return self.width * self.height - ones
+
+    def asList(self, key=True):
+        bits = self.bits
+        if not key:
+            bits = ~bits & ((1 << (self.width * self.height)) - 1)
+        list = []
+        while bits:
+            lowest = bits & -bits
+            list.append(divmod(lowest.bit_length() - 1, self.height))
+            bits ^= lowest
+        return list
+
+    def packBits(self):
+        """
+        Returns the same int list representation as Grid.packBits
+
+        (width, height, bitPackedInts...)
+
+        Each packed int holds the next CELLS_PER_INT cells, the first one in
+        its most significant bit, so the cells are reversed once as a string
+        of binary digits and cut into slices.
+        """
+        cells = self.width * self.height
+        digits = format(self.bits, '0%db' % cells)[::-1]
+        size = (cells // self.CELLS_PER_INT + 1) * self.CELLS_PER_INT
+        digits = digits.ljust(size, '0')
+        bits = [self.width, self.height]
+        for i in range(0, size, self.CELLS_PER_INT):
+            bits.append(int(digits[i:i + self.CELLS_PER_INT], 2))
+        return tuple(bits)
+
+    def _unpackBits(self, bits):
+        """
+        Fills in data from a bit-level representation
+        """
+        if any(packed < 0 for packed in bits):
+            raise ValueError("must be a positive integer")
+        cells = self.width * self.height
+        digits = ''.join([format(packed, '0%db' % self.CELLS_PER_INT)[-self.CELLS_PER_INT:]
+                          for packed in bits])[:cells]
+        if digits:
+            # Cells missing from the representation keep their initial value
+            kept = self.bits >> len(digits) << len(digits)
+            self.bits = kept | int(digits[::-1], 2)
+
+
+class BitGridColumn:
+    """
+    The column x of a BitGrid, read and written as grid[x][y].
+    """
+    __slots__ = ('grid', 'offset')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+
+    def _bit(self, y):
+        if y < 0:
+            y += self.grid.height
+        if not 0 <= y < self.grid.height:
+            raise IndexError('grid index out of range')
+        return 1 << (self.offset + y)
+
+    def __getitem__(self, y):
+        return self.grid.bits & self._bit(y) != 0
+
+    def __setitem__(self, y, value):
+        if value:
+            self.grid.bits |= self._bit(y)
+        else:
+            self.grid.bits &= ~self._bit(y)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        bits = self.grid.bits >> self.offset
+        for y in range(self.grid.height):
+            yield bits >> y & 1 == 1
+
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1, 2)):
         return bitRep
     width, height = bitRep[:2]
-    return Grid(width, height, bitRepresentation=bitRep[2:])
+    return BitGrid(width, height, bitRepresentation=bitRep[2:])
 
 ####################################
 # Parts you shouldn't have to read #
 ####################################
 
+_ZOBRIST_KEYS = {}
+
+
+def zobristKey(*feature):
+    """
+    Returns the 64-bit Zobrist key of a feature of a game state (e.g. a
+    food cell). The keys are derived from the feature itself, so they are
+    the same in every process.
+    """
+    key = _ZOBRIST_KEYS.get(feature)
+    if key is None:
+        digest = hashlib.blake2b(repr(feature).encode(), digest_size=8).digest()
+        key = _ZOBRIST_KEYS[feature] = int.from_bytes(digest, 'little')
+    return key
+
+
+def agentZobristKey(index, agentState):
+    conf = agentState.configuration
+    if conf == None:
+        return zobristKey('agent', index, None, agentState.scaredTimer)
+    x, y = conf.pos
+    # Positions are compared by value, so 1 and 1.0 must have the same key
+    return zobristKey('agent', index, float(x), float(y), conf.direction, agentState.scaredTimer)
+
 
 class Actions:
     """
@@ -349,8 +552,18 @@ class Actions:
         return (dx * speed, dy * speed)
     directionToVector = staticmethod(directionToVector)
 
+    def getLegalMoves(walls):
+        """
+        Returns the LegalMoves table of a walls grid. It is built the first
+        time it is needed (by Layout, on load) and kept with the grid.
+        """
+        moves = getattr(walls, 'legalMoves', None)
+        if moves is None:
+            moves = walls.legalMoves = LegalMoves(walls)
+        return moves
+    getLegalMoves = staticmethod(getLegalMoves)
+
     def getPossibleActions(config, walls):
-        possible = []
         x, y = config.pos
         x_int, y_int = int(x + 0.5), int(y + 0.5)
 
@@ -358,32 +571,16 @@ class Actions:
         if (abs(x - x_int) + abs(y - y_int) > Actions.TOLERANCE):
             return [config.getDirection()]
 
-        for dir, vec in Actions._directionsAsList:
-            dx, dy = vec
-            next_y = y_int + dy
-            next_x = x_int + dx
-            if not walls[next_x][next_y]:
-                possible.append(dir)
-
-        return possible
+        moves = Actions.getLegalMoves(walls)
+        return list(moves.actions[x_int * moves.height + y_int])
 
     getPossibleActions = staticmethod(getPossibleActions)
 
     def getLegalNeighbors(position, walls):
         x, y = position
         x_int, y_int = int(x + 0.5), int(y + 0.5)
-        neighbors = []
-        for dir, vec in Actions._directionsAsList:
-            dx, dy = vec
-            next_x = x_int + dx
-            if next_x < 0 or next_x == walls.width:
-                continue
-            next_y = y_int + dy
-            if next_y < 0 or next_y == walls.height:
-                continue
-            if not walls[next_x][next_y]:
-                neighbors.append((next_x, next_y))
-        return neighbors
+        moves = Actions.getLegalMoves(walls)
+        return list(moves.neighbors[x_int * moves.height + y_int])
     getLegalNeighbors = staticmethod(getLegalNeighbors)
 
     def getSuccessor(position, action):
@@ -393,6 +590,40 @@ class Actions:
     getSuccessor = staticmethod(getSuccessor)
 
 
+class LegalMoves:
+    """
+    The legal moves from every cell of a walls grid, computed once so that
+    Actions and the search problems answer with a single lookup.  The cell
+    (x,y) has the id x * height + y, like its bit in a BitGrid.
+
+    actions[id]     the directions allowed from the cell, Stop included, in
+                    the order of Actions._directionsAsList
+    neighbors[id]   the cells these directions lead to
+    successors[id]  the (cell, direction) pairs of the moves to the other
+                    cells, in the North, South, East, West order in which
+                    the search problems generate their successors
+    """
+    SEARCH_ORDER = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+
+    def __init__(self, walls):
+        self.height = walls.height
+        self.actions = []
+        self.neighbors = []
+        self.successors = []
+        for x in range(walls.width):
+            for y in range(walls.height):
+                moves = {}
+                for direction, (dx, dy) in Actions._directionsAsList:
+                    next_x, next_y = x + dx, y + dy
+                    if 0 <= next_x < walls.width and 0 <= next_y < walls.height \
+                            and not walls[next_x][next_y]:
+                        moves[direction] = (next_x, next_y)
+                self.actions.append(tuple(moves))
+                self.neighbors.append(tuple(moves.values()))
+                self.successors.append(tuple([(moves[direction], direction)
+                                              for direction in self.SEARCH_ORDER if direction in moves]))
+
+
 class GameStateData:
 
     def __init__(self, prevState=None):
@@ -400,12 +631,24 @@ class GameStateData:
         Generates a new data packet by copying information from its predecessor.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates(prevState.agentStates)
+            # The food, the capsules, _eaten and the AgentStates are shared
+            # with the predecessor; they are replaced rather than modified
+            # when they change (copy-on-write)
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
+            self._sharedAgents = (1 << len(self.agentStates)) - 1 # Bit i: agentStates[i] is shared
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._foodHash = prevState._foodHash
+            self._capsuleHash = prevState._capsuleHash
+            self._agentHash = prevState._agentHash
+        else:
+            self._sharedAgents = 0
+            # Zobrist hashes of the food, the capsules and the agents; None
+            # until they are computed from scratch by __hash__ or initialize
+            self._foodHash = self._capsuleHash = self._agentHash = None
 
         self._foodEaten = None
         self._foodAdded = None
@@ -418,6 +661,10 @@ class GameStateData:
     def deepCopy(self):
         state = GameStateData(self)
         state.food = self.food.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates(self.agentStates)
+        state._sharedAgents = 0
+        state._eaten = self._eaten[:]
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
@@ -425,6 +672,75 @@ class GameStateData:
         state._capsuleEaten = self._capsuleEaten
         return state
 
+    def shallowCopy(self):
+        """
+        Returns a copy that shares the food, the capsules, the AgentStates and
+        the layout with this one. The game rules replace rather than modify
+        them, so the copy keeps its value as the game goes on, as long as
+        nobody writes to it directly.
+        """
+        state = GameStateData(self)
+        state._agentMoved = self._agentMoved
+        state._foodEaten = self._foodEaten
+        state._foodAdded = self._foodAdded
+        state._capsuleEaten = self._capsuleEaten
+        return state
+
+    def getMutableAgentState(self, agentIndex):
+        """
+        Returns the AgentState of the agent for writing. If it is still shared
+        with the predecessor state, it is copied first.
+        """
+        if self._sharedAgents >> agentIndex & 1:
+            self.agentStates[agentIndex] = self.agentStates[agentIndex].copy()
+            self._sharedAgents &= ~(1 << agentIndex)
+        return self.agentStates[agentIndex]
+
+    def removeFood(self, x, y):
+        """
+        Removes the food at (x, y), replacing the shared food Grid, and
+        updates the food hash.
+        """
+        self.food = self.food.withCell(x, y, False)
+        if self._foodHash is not None:
+            self._foodHash ^= zobristKey('food', x, y)
+
+    def removeCapsule(self, position):
+        """
+        Removes the capsule at position, replacing the shared capsule list,
+        and updates the capsule hash.
+        """
+        self.capsules = [capsule for capsule in self.capsules if capsule != position]
+        if self._capsuleHash is not None:
+            self._capsuleHash ^= zobristKey('capsule', position[0], position[1])
+
+    def updateAgentHash(self, prevState):
+        """
+        Updates the agent hash inherited from prevState (the GameStateData
+        this one was generated from) for the AgentStates that were replaced.
+        """
+        if self._agentHash is None:
+            return
+        changed = ((1 << len(self.agentStates)) - 1) & ~self._sharedAgents
+        index = 0
+        while changed:
+            if changed & 1:
+                self._agentHash ^= agentZobristKey(index, prevState.agentStates[index]) ^ \
+                    agentZobristKey(index, self.agentStates[index])
+            changed >>= 1
+            index += 1
+
+    def _computeHashes(self):
+        self._foodHash = 0
+        for x, y in self.food.asList():
+            self._foodHash ^= zobristKey('food', x, y)
+        self._capsuleHash = 0
+        for x, y in self.capsules:
+            self._capsuleHash ^= zobristKey('capsule', x, y)
+        self._agentHash = 0
+        for index, agentState in enumerate(self.agentStates):
+            self._agentHash ^= agentZobristKey(index, agentState)
+
     def copyAgentStates(self, agentStates):
         copiedStates = []
         for agentState in agentStates:
@@ -451,14 +767,14 @@ class GameStateData:
     def __hash__(self):
         """
         Allows states to be keys of dictionaries.
+
+        The hash is the xor of Zobrist keys of the food cells, the capsules
+        and the agent states, kept up to date by the game rules as food is
+        eaten and agents move, so it costs O(1).
         """
-        for i, state in enumerate(self.agentStates):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                # hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113 * hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575)
+        if self._foodHash is None or self._capsuleHash is None or self._agentHash is None:
+            self._computeHashes()
+        return hash(self._foodHash ^ self._capsuleHash ^ self._agentHash ^ hash(self.score))
 
     def __str__(self):
         width, height = self.layout.width, self.layout.height
@@ -536,6 +852,7 @@ class GameStateData:
             self.agentStates.append(AgentState(
                 Configuration(pos, Directions.STOP), isPacman))
         self._eaten = [False for a in self.agentStates]
+        self._computeHashes()
 
 
 try:
@@ -550,7 +867,8 @@ class Game:
     The Game manages the control flow, soliciting actions from agents.
     """
 
-    def __init__(self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False):
+    def __init__(self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False,
+                 trustAgents=False, checkObservations=False):
         self.agentCrashed = False
         self.agents = agents
         self.display = display
@@ -559,9 +877,15 @@ class Game:
         self.gameOver = False
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
+        # Trusted agents observe shallow copies of the state, and are checked
+        # for writing to them if checkObservations is set
+        self.trustAgents = trustAgents
+        self.checkObservations = checkObservations
         self.moveHistory = []
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
+        # The time each agent took to choose each of its moves
+        self.moveTimes = [[] for agent in agents]
         self.agentTimeout = False
         import io
         self.agentOutput = [io.StringIO() for agent in agents]
@@ -601,6 +925,24 @@ class Game:
         sys.stdout = OLD_STDOUT
         sys.stderr = OLD_STDERR
 
+    def observe(self):
+        """
+        Returns the copy of the state handed to an agent: a deep copy, or a
+        shallow copy that costs the same on any board for trusted agents.
+        """
+        if self.trustAgents:
+            return self.state.shallowCopy()
+        return self.state.deepCopy()
+
+    def _checkObservation(self, agentIndex, snapshot):
+        """
+        Raises an exception if a trusted agent changed the state since the
+        snapshot was taken, by writing to its shallow copy.
+        """
+        data = self.state.data
+        if not (data == snapshot.data and data.layout.walls == snapshot.data.layout.walls):
+            raise Exception('Agent %d modified the state it observed' % agentIndex)
+
     def run(self):
         """
         Main control loop for game play.
@@ -621,15 +963,17 @@ class Game:
                 self._agentCrash(i, quiet=True)
                 return
             if ("registerInitialState" in dir(agent)):
+                if self.checkObservations:
+                    snapshot = self.state.deepCopy()
                 self.mute(i)
                 if self.catchExceptions:
                     try:
                         timed_func = TimeoutFunction(
-                            agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                            agent.registerInitialState, self.rules.getMaxStartupTime(i))
                         try:
-                            start_time = time.time()
-                            timed_func(self.state.deepCopy())
-                            time_taken = time.time() - start_time
+                            start_time = time.perf_counter()
+                            timed_func(self.observe())
+                            time_taken = time.perf_counter() - start_time
                             self.totalAgentTimes[i] += time_taken
                         except TimeoutFunctionException:
                             print("Agent %d ran out of time on startup!" %
@@ -643,9 +987,11 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    agent.registerInitialState(self.observe())
                 # TODO: could this exceed the total time
                 self.unmute()
+                if self.checkObservations:
+                    self._checkObservation(i, snapshot)
 
         agentIndex = self.startingIndex
         numAgents = len(self.agents)
@@ -655,40 +1001,41 @@ class Game:
             agent = self.agents[agentIndex]
             move_time = 0
             skip_action = False
+            if self.checkObservations:
+                snapshot = self.state.deepCopy()
             # Generate an observation of the state
             if 'observationFunction' in dir(agent):
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(
-                            self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(
+                            agent.observationFunction, self.rules.getMoveTimeout(agentIndex))
                         try:
-                            start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            start_time = time.perf_counter()
+                            observation = timed_func(self.observe())
                         except TimeoutFunctionException:
                             skip_action = True
-                        move_time += time.time() - start_time
+                        move_time += time.perf_counter() - start_time
                         self.unmute()
                     except Exception as data:
                         self._agentCrash(agentIndex, quiet=False)
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(
-                        self.state.deepCopy())
+                    observation = agent.observationFunction(self.observe())
                 self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self.observe()
 
             # Solicit an action
             action = None
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(
-                        self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = TimeoutFunction(
+                        agent.getAction, self.rules.getMoveTimeout(agentIndex) - move_time)
                     try:
-                        start_time = time.time()
+                        start_time = time.perf_counter()
                         if skip_action:
                             raise TimeoutFunctionException()
                         action = timed_func(observation)
@@ -700,7 +1047,7 @@ class Game:
                         self.unmute()
                         return
 
-                    move_time += time.time() - start_time
+                    move_time += time.perf_counter() - start_time
 
                     if move_time > self.rules.getMoveWarningTime(agentIndex):
                         self.totalAgentTimeWarnings[agentIndex] += 1
@@ -729,8 +1076,13 @@ class Game:
                     self.unmute()
                     return
             else:
+                start_time = time.perf_counter()
                 action = agent.getAction(observation)
+                move_time += time.perf_counter() - start_time
             self.unmute()
+            self.moveTimes[agentIndex].append(move_time)
+            if self.checkObservations:
+                self._checkObservation(agentIndex, snapshot)
 
             # Execute the action
             self.moveHistory.append((agentIndex, action))
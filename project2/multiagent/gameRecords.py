@@ -0,0 +1,200 @@
+# gameRecords.py
+# --------------
+# Compact binary recordings of Pacman games, with seekable replay.
+
+"""
+A recording stores a game as its layout and its actions, with the state of
+the game every CHECKPOINT_INTERVAL moves, so that the state after any move
+can be restored without playing the game again from its start:
+
+> recording = GameRecording(layout, game.moveHistory)
+> recording.save('game.rec')
+> state = loadRecording('game.rec').stateAt(500)
+
+The file holds, in this order (little-endian):
+
+  header        magic, version, layout fingerprint, number of agents,
+                number of moves, checkpoint interval
+  layout        the zlib-compressed text of the layout
+  actions       2 bits per move (North, South, East, West); the agent of
+                move i is i % number of agents, as agents play in turn
+  stops         the moves that were Stop, which were written as North
+  checkpoints   the states after CHECKPOINT_INTERVAL, 2 * CHECKPOINT_INTERVAL,
+                ... moves: score, end flags, food bits, capsules and, for
+                each agent, position, direction, scared timer and eaten flag
+"""
+
+import struct
+import zlib
+
+import layout
+from game import Directions, Configuration
+from pacman import GameState
+
+MAGIC = b'PACR'
+VERSION = 1
+CHECKPOINT_INTERVAL = 64
+
+ACTION_CODES = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+DIRECTION_CODES = ACTION_CODES + [Directions.STOP]
+
+_HEADER = struct.Struct('<4sB16sHIH')
+_COUNT = struct.Struct('<I')
+_STATE = struct.Struct('<dBBH')  # Score, win, lose, number of capsules
+_CAPSULE = struct.Struct('<HH')
+_AGENT = struct.Struct('<ddBHB')  # x, y, direction, scared timer, eaten
+
+
+class GameRecording:
+    """
+    A recorded game.  actions is a list of (agentIndex, action) pairs, like
+    Game.moveHistory, in which the agents play in turn from agent 0.  The
+    checkpoints are computed by playing the actions when they are not given.
+    """
+
+    def __init__(self, layout, actions, numAgents=None, checkpointInterval=CHECKPOINT_INTERVAL,
+                 checkpoints=None):
+        self.layout = layout
+        if numAgents == None:
+            numAgents = len(layout.agentPositions)
+        self.numAgents = numAgents
+        self.checkpointInterval = checkpointInterval
+        self.numMoves = len(actions)
+        codes = bytearray((self.numMoves + 3) // 4)
+        self.stops = set()
+        for move, (agentIndex, action) in enumerate(actions):
+            if agentIndex != move % numAgents:
+                raise Exception('Move %d was played by agent %d out of turn' % (move, agentIndex))
+            if action == Directions.STOP:
+                self.stops.add(move)
+            else:
+                codes[move >> 2] |= ACTION_CODES.index(action) << ((move & 3) * 2)
+        self.codes = bytes(codes)
+        if checkpoints == None:
+            checkpoints = self._computeCheckpoints()
+        self.checkpoints = checkpoints
+
+    def actionAt(self, move):
+        "Returns the (agentIndex, action) pair of a move"
+        if move in self.stops:
+            return move % self.numAgents, Directions.STOP
+        code = self.codes[move >> 2] >> ((move & 3) * 2) & 3
+        return move % self.numAgents, ACTION_CODES[code]
+
+    def getActions(self):
+        return [self.actionAt(move) for move in range(self.numMoves)]
+
+    def initialState(self):
+        state = GameState()
+        state.initialize(self.layout, self.numAgents - 1)
+        return state
+
+    def stateAt(self, move):
+        """
+        Returns the state after the first move moves, played from the last
+        checkpoint before it, so at most checkpointInterval - 1 moves are
+        played.
+        """
+        if not 0 <= move <= self.numMoves:
+            raise IndexError('The recording has %d moves' % self.numMoves)
+        checkpoint = move // self.checkpointInterval
+        if checkpoint == 0:
+            state = self.initialState()
+        else:
+            state = self.unpackState(self.checkpoints[checkpoint - 1])
+        for played in range(checkpoint * self.checkpointInterval, move):
+            state = state.generateSuccessor(*self.actionAt(played))
+        return state
+
+    def _computeCheckpoints(self):
+        checkpoints = []
+        state = self.initialState()
+        for move in range(self.numMoves):
+            state = state.generateSuccessor(*self.actionAt(move))
+            if (move + 1) % self.checkpointInterval == 0:
+                checkpoints.append(self.packState(state))
+        return checkpoints
+
+    def packState(self, state):
+        "Returns the state, of a game on this layout, packed as a checkpoint"
+        data = state.data
+        food = data.food.bits.to_bytes((data.food.width * data.food.height + 7) // 8, 'little')
+        parts = [_STATE.pack(data.score, data._win, data._lose, len(data.capsules)), food]
+        for x, y in data.capsules:
+            parts.append(_CAPSULE.pack(x, y))
+        for agentState, eaten in zip(data.agentStates, data._eaten):
+            x, y = agentState.configuration.getPosition()
+            direction = DIRECTION_CODES.index(agentState.configuration.getDirection())
+            parts.append(_AGENT.pack(x, y, direction, agentState.scaredTimer, eaten))
+        return b''.join(parts)
+
+    def unpackState(self, packed):
+        "Returns the state packed by packState"
+        state = self.initialState()
+        data = state.data
+        score, win, lose, numCapsules = _STATE.unpack_from(packed, 0)
+        offset = _STATE.size
+        data.score, data._win, data._lose = score, bool(win), bool(lose)
+        foodBytes = (data.food.width * data.food.height + 7) // 8
+        data.food.bits = int.from_bytes(packed[offset:offset + foodBytes], 'little')
+        offset += foodBytes
+        data.capsules = []
+        for i in range(numCapsules):
+            data.capsules.append(_CAPSULE.unpack_from(packed, offset))
+            offset += _CAPSULE.size
+        for index, agentState in enumerate(data.agentStates):
+            x, y, direction, scaredTimer, eaten = _AGENT.unpack_from(packed, offset)
+            offset += _AGENT.size
+            agentState.configuration = Configuration((x, y), DIRECTION_CODES[direction])
+            agentState.scaredTimer = scaredTimer
+            data._eaten[index] = bool(eaten)
+        data._computeHashes()
+        return state
+
+    def save(self, path):
+        layoutText = zlib.compress('\n'.join(self.layout.layoutText).encode())
+        stops = sorted(self.stops)
+        parts = [_HEADER.pack(MAGIC, VERSION, bytes.fromhex(self.layout.fingerprint), self.numAgents,
+                              self.numMoves, self.checkpointInterval),
+                 _COUNT.pack(len(layoutText)), layoutText, self.codes,
+                 _COUNT.pack(len(stops)), struct.pack('<%dI' % len(stops), *stops),
+                 _COUNT.pack(len(self.checkpoints))]
+        for checkpoint in self.checkpoints:
+            parts.append(_COUNT.pack(len(checkpoint)))
+            parts.append(checkpoint)
+        with open(path, 'wb') as f:
+            f.write(b''.join(parts))
+
+
+def loadRecording(path):
+    "Reads a GameRecording saved by GameRecording.save"
+    with open(path, 'rb') as f:
+        packed = f.read()
+    magic, version, fingerprint, numAgents, numMoves, interval = _HEADER.unpack_from(packed, 0)
+    if magic != MAGIC or version != VERSION:
+        raise Exception('%s is not a version %d game recording' % (path, VERSION))
+    offset = _HEADER.size
+
+    def readBlock(offset):
+        size, = _COUNT.unpack_from(packed, offset)
+        return packed[offset + _COUNT.size:offset + _COUNT.size + size], offset + _COUNT.size + size
+
+    layoutText, offset = readBlock(offset)
+    recordedLayout = layout.Layout(zlib.decompress(layoutText).decode().split('\n'))
+    if bytes.fromhex(recordedLayout.fingerprint) != fingerprint:
+        raise Exception('The layout of %s does not match its fingerprint' % path)
+
+    recording = GameRecording(recordedLayout, [], numAgents, interval, [])
+    recording.numMoves = numMoves
+    recording.codes = packed[offset:offset + (numMoves + 3) // 4]
+    offset += len(recording.codes)
+    numStops, = _COUNT.unpack_from(packed, offset)
+    offset += _COUNT.size
+    recording.stops = set(struct.unpack_from('<%dI' % numStops, packed, offset))
+    offset += 4 * numStops
+    numCheckpoints, = _COUNT.unpack_from(packed, offset)
+    offset += _COUNT.size
+    for i in range(numCheckpoints):
+        checkpoint, offset = readBlock(offset)
+        recording.checkpoints.append(checkpoint)
+    return recording
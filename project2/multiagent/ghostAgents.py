@@ -19,6 +19,23 @@ import random
 from util import manhattanDistance
 import util
 
+try:
+    import numpy as np
+    _NUMPY_ENABLED = True
+except ImportError:
+    _NUMPY_ENABLED = False
+
+# The actions of a moving ghost, in the order of the columns of the
+# probability arrays below, and the directions a ghost can face
+GHOST_ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+GHOST_DIRECTIONS = GHOST_ACTIONS + [Directions.STOP]
+_DIRECTION_INDEX = dict([(direction, i) for i, direction in enumerate(GHOST_DIRECTIONS)])
+
+# The fewest distributions directionalDistributions computes with NumPy: a
+# call costs about 65 us whatever its size, and getDistribution about 7 us
+# per ghost, so smaller batches are computed one ghost at a time
+BATCH_MINIMUM = 10
+
 
 class GhostAgent(Agent):
     def __init__(self, index):
@@ -91,3 +108,132 @@ class DirectionalGhost(GhostAgent):
             dist[a] += (1-bestProb) / len(legalActions)
         dist.normalize()
         return dist
+
+    def getDistributions(self, states):
+        """
+        Returns the distributions of this ghost in each of states, computed
+        together by directionalDistributions when NumPy is available.
+        """
+        if not _NUMPY_ENABLED:
+            return [self.getDistribution(state) for state in states]
+        distributions = directionalDistributions(
+            states, [self.index], self.prob_attack, self.prob_scaredFlee)
+        return [ghosts[0] for ghosts in distributions]
+
+
+class GhostMoveTable:
+    """
+    The legal actions (see GhostRules.getLegalActions) of a ghost on each
+    cell of a walls grid, for each direction it can face, as NumPy arrays.
+    legal[id * 5 + d] is the mask over GHOST_ACTIONS of a ghost on the cell
+    id (x * height + y) facing GHOST_DIRECTIONS[d], and straight[d] the mask
+    of a ghost between grid points, which must continue straight.
+    """
+
+    def __init__(self, walls):
+        moves = Actions.getLegalMoves(walls)
+        self.height = walls.height
+        self.legal = np.zeros((len(moves.actions) * 5, 4), dtype=bool)
+        for cell, actions in enumerate(moves.actions):
+            for d, direction in enumerate(GHOST_DIRECTIONS):
+                possible = [a for a in actions if a != Directions.STOP]
+                reverse = Actions.reverseDirection(direction)
+                if reverse in possible and len(possible) > 1:
+                    possible.remove(reverse)
+                for action in possible:
+                    self.legal[cell * 5 + d, GHOST_ACTIONS.index(action)] = True
+        self.straight = np.zeros((5, 4), dtype=bool)
+        for d in range(4):
+            self.straight[d, d] = True
+        self.vectors = np.array([Actions.directionToVector(a) for a in GHOST_ACTIONS])
+
+
+def getGhostMoveTable(walls):
+    "Returns the GhostMoveTable of a walls grid, built once and kept with it"
+    table = getattr(walls, 'ghostMoves', None)
+    if table is None:
+        table = walls.ghostMoves = GhostMoveTable(walls)
+    return table
+
+
+def directionalProbabilities(walls, positions, directions, scared, pacmanPositions,
+                             prob_attack=0.8, prob_scaredFlee=0.8):
+    """
+    Computes the DirectionalGhost distributions of n ghosts at once, with
+    NumPy.  The ghosts are given as arrays: their positions (n x 2), the
+    indices in GHOST_DIRECTIONS of the directions they face (n), whether they
+    are scared (n) and the position of Pacman in their state (n x 2).
+
+    Returns an n x 4 array of the probabilities of the GHOST_ACTIONS, zero
+    for illegal actions; the row of a ghost without legal action is zero.
+    """
+    table = getGhostMoveTable(walls)
+    positions = np.asarray(positions, dtype=float)
+    directions = np.asarray(directions, dtype=int)
+    scared = np.asarray(scared, dtype=bool)
+    pacmanPositions = np.asarray(pacmanPositions, dtype=float)
+
+    # Legal actions, from the cell nearest to each ghost
+    rounded = np.floor(positions + 0.5).astype(int)
+    legal = table.legal[(rounded[:, 0] * table.height + rounded[:, 1]) * 5 + directions]
+    offGrid = np.abs(positions - rounded).sum(axis=1) > Actions.TOLERANCE
+    if offGrid.any():
+        legal[offGrid] = table.straight[directions[offGrid]]
+
+    # Distances to Pacman after each action; scared ghosts move at half speed
+    speeds = np.where(scared, 0.5, 1.0)
+    newPositions = positions[:, None, :] + table.vectors[None, :, :] * speeds[:, None, None]
+    distances = np.abs(newPositions - pacmanPositions[:, None, :]).sum(axis=2)
+
+    # Select best actions: the farthest from Pacman when scared, else the nearest
+    farthest = np.where(legal, distances, -np.inf).max(axis=1)
+    nearest = np.where(legal, distances, np.inf).min(axis=1)
+    best = legal & (distances == np.where(scared, farthest, nearest)[:, None])
+    bestProbs = np.where(scared, prob_scaredFlee, prob_attack)
+
+    # Construct distributions
+    numBest = np.maximum(best.sum(axis=1), 1)
+    numLegal = np.maximum(legal.sum(axis=1), 1)
+    probs = best * (bestProbs / numBest)[:, None] + legal * ((1 - bestProbs) / numLegal)[:, None]
+    totals = probs.sum(axis=1)
+    return probs / np.where(totals > 0, totals, 1)[:, None]
+
+
+def directionalDistributions(states, ghostIndices, prob_attack=0.8, prob_scaredFlee=0.8):
+    """
+    Returns the DirectionalGhost distributions of the ghosts ghostIndices in
+    each of states, which share a layout, as a list (per state) of lists
+    (per ghost) of Counters.  All of them are computed by a single
+    directionalProbabilities call, or one ghost at a time without NumPy or
+    when there are fewer than BATCH_MINIMUM of them.
+    """
+    if not _NUMPY_ENABLED or len(states) * len(ghostIndices) < BATCH_MINIMUM:
+        return [[DirectionalGhost(index, prob_attack, prob_scaredFlee).getDistribution(state)
+                 for index in ghostIndices] for state in states]
+    rows = []
+    for state in states:
+        pacmanPosition = state.getPacmanPosition()
+        for index in ghostIndices:
+            ghostState = state.data.agentStates[index]
+            x, y = ghostState.configuration.pos
+            rows.append((x, y, _DIRECTION_INDEX[ghostState.configuration.direction],
+                         ghostState.scaredTimer > 0) + tuple(pacmanPosition))
+    if not rows:
+        return [[] for state in states]
+    columns = np.array(rows, dtype=float)
+    probs = directionalProbabilities(states[0].data.layout.walls, columns[:, 0:2],
+                                     columns[:, 2].astype(int), columns[:, 3] > 0,
+                                     columns[:, 4:6], prob_attack, prob_scaredFlee)
+    distributions = []
+    row = 0
+    for state in states:
+        ghosts = []
+        for index in ghostIndices:
+            dist = util.Counter()
+            for action, prob in zip(GHOST_ACTIONS, probs[row].tolist()):
+                if prob > 0:
+                    dist[action] = prob
+            ghosts.append(dist)
+            row += 1
+        distributions.append(ghosts)
+    return distributions
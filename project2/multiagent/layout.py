@@ -13,30 +13,55 @@
 
 
 from util import manhattanDistance
-from game import Grid
+from game import Grid, BitGrid, Actions
 import os
 import random
-from functools import reduce
+import hashlib
+import pickle
+from collections import OrderedDict
 
 VISIBILITY_MATRIX_CACHE = {}
 
+# The parsed layouts (walls, food, capsules, agent positions and number of
+# ghosts) by fingerprint, the least recently used first
+LAYOUT_CACHE = OrderedDict()
+LAYOUT_CACHE_SIZE = 64
+
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts with the same text share their parsed walls through LAYOUT_CACHE,
+    so building or copying a known layout does not parse it again.  The
+    walls must not be modified.
     """
 
     def __init__(self, layoutText):
         self.width = len(layoutText[0])
         self.height = len(layoutText)
-        self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
-        self.capsules = []
-        self.agentPositions = []
-        self.numGhosts = 0
-        self.processLayoutText(layoutText)
         self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.fingerprint = layoutFingerprint(layoutText)
+        parsed = LAYOUT_CACHE.get(self.fingerprint)
+        if parsed == None:
+            self.walls = Grid(self.width, self.height, False)
+            self.food = BitGrid(self.width, self.height, False)
+            self.capsules = []
+            self.agentPositions = []
+            self.numGhosts = 0
+            self.processLayoutText(layoutText)
+            Actions.getLegalMoves(self.walls)  # Builds the legal move table of the walls
+            parsed = (self.walls, self.food, self.capsules, self.agentPositions, self.numGhosts)
+            cacheLayout(self.fingerprint, parsed)
+        else:
+            LAYOUT_CACHE.move_to_end(self.fingerprint)
+        # Everything but the walls is copied, as the copies are cheap
+        walls, food, capsules, agentPositions, self.numGhosts = parsed
+        self.walls = walls
+        self.food = food.copy()
+        self.capsules = capsules[:]
+        self.agentPositions = agentPositions[:]
+        self.totalFood = self.food.count()
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -44,7 +69,7 @@ class Layout:
 
     def initializeVisibilityMatrix(self):
         global VISIBILITY_MATRIX_CACHE
-        if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
+        if self.fingerprint not in VISIBILITY_MATRIX_CACHE:
             from game import Directions
             vecs = [(-0.5, 0), (0.5, 0), (0, -0.5), (0, 0.5)]
             dirs = [Directions.NORTH, Directions.SOUTH,
@@ -61,10 +86,9 @@ class Layout:
                                 vis[x][y][direction].add((nextx, nexty))
                                 nextx, nexty = x + dx, y + dy
             self.visibility = vis
-            VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
+            VISIBILITY_MATRIX_CACHE[self.fingerprint] = vis
         else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(
-                str.__add__, self.layoutText)]
+            self.visibility = VISIBILITY_MATRIX_CACHE[self.fingerprint]
 
     def isWall(self, pos):
         x, col = pos
@@ -137,6 +161,39 @@ class Layout:
             self.numGhosts += 1
 
 
+def layoutFingerprint(layoutText):
+    "A hash of the text of a layout, the key of its cached data"
+    return hashlib.blake2b('\n'.join(layoutText).encode(), digest_size=16).hexdigest()
+
+
+def cacheLayout(fingerprint, parsed):
+    "Adds a parsed layout to LAYOUT_CACHE, dropping the least recently used ones"
+    LAYOUT_CACHE[fingerprint] = parsed
+    while len(LAYOUT_CACHE) > LAYOUT_CACHE_SIZE:
+        LAYOUT_CACHE.popitem(last=False)
+
+
+def saveLayoutCache(path):
+    "Saves the parsed layouts and the visibility matrices for later runs"
+    with open(path, 'wb') as f:
+        pickle.dump({'layouts': LAYOUT_CACHE, 'visibility': VISIBILITY_MATRIX_CACHE}, f)
+
+
+def loadLayoutCache(path):
+    """
+    Adds the layouts and the visibility matrices saved by saveLayoutCache
+    to the caches.  Returns False if there is no file at path.
+    """
+    if not os.path.exists(path):
+        return False
+    with open(path, 'rb') as f:
+        saved = pickle.load(f)
+    for fingerprint, parsed in saved['layouts'].items():
+        cacheLayout(fingerprint, parsed)
+    VISIBILITY_MATRIX_CACHE.update(saved['visibility'])
+    return True
+
+
 def getLayout(name, back=2):
     if name.endswith('.lay'):
         layout = tryToLoad('layouts/' + name)
@@ -16,9 +16,16 @@ from util import manhattanDistance
 from game import Directions
 import random, util
 import math # To use the infinity values
+import time
+import gc
+import multiprocessing
+from collections import OrderedDict
 
 from game import Agent
 from pacman import GameState
+import layout
+from gameRecords import GameRecording
+from ghostAgents import RandomGhost, DirectionalGhost, directionalDistributions
 
 class ReflexAgent(Agent):
     """
@@ -106,6 +113,96 @@ def scoreEvaluationFunction(currentGameState: GameState):
     """
     return currentGameState.getScore()
 
+class TranspositionTable:
+    """
+    A bounded table of search results, keyed by (state, depth, agentIndex).
+    An entry is a (value, flag, action) triple: flag tells whether value is
+    the EXACT value of the node or only a LOWER or UPPER bound of it, as
+    alpha-beta returns when it prunes; expectimax values are always exact.
+
+    When the table is full, the eviction policy chooses the entry to drop:
+      'lru'    the least recently used one
+      'fifo'   the oldest one
+      'depth'  the oldest of those with the least remaining depth, which
+               are the cheapest to search again
+    """
+    EXACT, LOWER, UPPER = 0, 1, 2
+    POLICIES = ['lru', 'fifo', 'depth']
+
+    def __init__(self, size=100000, policy='lru'):
+        if policy not in self.POLICIES:
+            raise Exception('Unknown eviction policy: %s' % policy)
+        self.size = size
+        self.policy = policy
+        self.entries = OrderedDict()
+        self.keysByDepth = {} # For the 'depth' policy: depth -> keys, oldest first
+        self.hits = self.lookups = self.evictions = 0
+
+    def lookup(self, key):
+        self.lookups += 1
+        entry = self.entries.get(key)
+        if entry != None:
+            self.hits += 1
+            if self.policy == 'lru':
+                self.entries.move_to_end(key)
+        return entry
+
+    def store(self, key, entry):
+        if key in self.entries:
+            self.entries[key] = entry
+            if self.policy == 'lru':
+                self.entries.move_to_end(key)
+            return
+        if len(self.entries) >= self.size:
+            self.evict()
+        self.entries[key] = entry
+        if self.policy == 'depth':
+            self.keysByDepth.setdefault(key[1], OrderedDict())[key] = None
+
+    def evict(self):
+        if self.policy == 'depth':
+            depth = min(depth for depth, keys in self.keysByDepth.items() if keys)
+            key, _ = self.keysByDepth[depth].popitem(last=False)
+            del self.entries[key]
+        else:
+            self.entries.popitem(last=False)
+        self.evictions += 1
+
+    def hitRate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def __str__(self):
+        return 'Transposition table: %d entries, %d hits in %d lookups (%.1f%%), %d evictions' % (
+            len(self.entries), self.hits, self.lookups, 100 * self.hitRate(), self.evictions)
+
+class SearchTimeout(Exception):
+    """
+    Raised by the search when the time budget of the move has run out
+    """
+    pass
+
+"""
+Root-parallel search: the worker processes of a pool each hold a serial copy
+of the agent and the layout, and search the root moves they are sent as
+packed states against the best root value found so far, which they share.
+"""
+
+_worker = {}
+
+def _init_root_worker(layout_text, num_agents, agent_name, agent_args, alpha):
+    _worker['packer'] = GameRecording(layout.Layout(layout_text), [], num_agents, checkpoints=[])
+    _worker['agent'] = globals()[agent_name](**agent_args)
+    _worker['alpha'] = alpha
+
+def _search_root_move(task):
+    packed, action = task
+    alpha = _worker['alpha']
+    gameState = _worker['packer'].unpackState(packed)
+    v = _worker['agent'].root_move_value(gameState, action, alpha.value)
+    with alpha.get_lock():
+        alpha.value = max(alpha.value, v)
+    return v
+
 class MultiAgentSearchAgent(Agent):
     """
     This class provides some common elements to all of your
@@ -121,10 +218,169 @@ class MultiAgentSearchAgent(Agent):
     is another abstract class.
     """
 
-    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2'):
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', tableSize = '0', eviction = 'lru',
+                 timeLimit = '0', workers = '0'):
         self.index = 0 # Pacman is always agent index 0
         self.evaluationFunction = util.lookup(evalFn, globals())
         self.depth = int(depth)
+        # Processes searching the root moves in parallel (0 searches serially)
+        self.workers = int(workers)
+        if self.workers > 0 and int(timeLimit) > 0:
+            raise Exception('Iterative deepening cannot be combined with parallel search')
+        self.search_args = {'evalFn': evalFn, 'depth': depth, 'tableSize': tableSize, 'eviction': eviction}
+        self.pool = None
+        self.pool_layout = None
+        # Milliseconds per move for iterative deepening (0 searches to self.depth)
+        self.timeLimit = int(timeLimit)
+        self.deadline = None # Set while deepening
+        self.pv = {} # (state, agentIndex) -> action along the last principal variation
+        self.best_replies = {}
+        # Transposition table, kept from move to move (off unless tableSize > 0)
+        self.table = None
+        if int(tableSize) > 0:
+            self.table = TranspositionTable(int(tableSize), eviction)
+
+    """Utility functions for the transposition table"""
+
+    def lookup_value(self, gameState, depth, agent_index, a=-math.inf, b=math.inf):
+        """
+        Returns the stored (value, action) of a node if it settles the node
+        for the window (a, b), else None
+        """
+        if self.table == None:
+            return None
+        entry = self.table.lookup((gameState, depth, agent_index))
+        if entry == None:
+            return None
+        value, flag, action = entry
+        if flag == TranspositionTable.EXACT or (flag == TranspositionTable.LOWER and value >= b) \
+                or (flag == TranspositionTable.UPPER and value <= a):
+            return value, action
+        return None
+
+    def store_value(self, gameState, depth, agent_index, value, action=None, a=-math.inf, b=math.inf):
+        """
+        Stores the value of a node searched with the window (a, b), given
+        before the search narrowed it
+        """
+        if self.table == None:
+            return
+        if value <= a:
+            flag = TranspositionTable.UPPER
+        elif value >= b:
+            flag = TranspositionTable.LOWER
+        else:
+            flag = TranspositionTable.EXACT
+        self.table.store((gameState, depth, agent_index), (value, flag, action))
+
+    def final(self, gameState):
+        if self.table != None:
+            print(self.table)
+        if self.pool != None:
+            self.pool.terminate()
+            self.pool = None
+
+    """Utility functions for root-parallel search"""
+
+    def parallel_decision(self, gameState):
+        """
+        Returns the action of the serial search, searching the first root move
+        here and the others in the worker processes (young brothers wait), with
+        the same preference for the first of equally good moves.
+        """
+        actions = gameState.getLegalActions(0)
+        values = [self.root_move_value(gameState, actions[0], -math.inf)]
+        if len(actions) > 1:
+            packer = self.root_pool(gameState)
+            self.alpha.value = values[0]
+            packed = packer.packState(gameState)
+            values += self.pool.map(_search_root_move, [(packed, action) for action in actions[1:]], chunksize=1)
+        best = 0
+        for i in range(1, len(actions)):
+            if values[i] > values[best]:
+                best = i
+        return actions[best]
+
+    def root_pool(self, gameState):
+        """
+        Starts the pool of worker processes for the layout of gameState, if it
+        is not running yet, and returns the packer of its states
+        """
+        game_layout = gameState.data.layout
+        if self.pool != None and self.pool_layout is game_layout:
+            return self.packer
+        if self.pool != None:
+            self.pool.terminate()
+        num_agents = gameState.getNumAgents()
+        self.alpha = multiprocessing.Value('d', -math.inf)
+        self.pool = multiprocessing.Pool(self.workers, _init_root_worker,
+                                         (game_layout.layoutText, num_agents, type(self).__name__,
+                                          self.search_args, self.alpha))
+        self.pool_layout = game_layout
+        self.packer = GameRecording(game_layout, [], num_agents, checkpoints=[])
+        return self.packer
+
+    def use_workers(self):
+        # The worker processes of pacman.py --workers cannot start processes of their own
+        return self.workers > 0 and not multiprocessing.current_process().daemon
+
+    """Utility functions for iterative deepening"""
+
+    def iterative_deepening(self, gameState, search):
+        """
+        Runs search(gameState, depth) with depth 1, 2, ... until self.timeLimit
+        milliseconds have passed, and returns the action found by the last
+        iteration that completed.  Each iteration tries the principal
+        variation of the previous one first.
+        """
+        self.deadline = time.perf_counter() + self.timeLimit / 1000
+        self.pv = {}
+        best_action = gameState.getLegalActions(0)[0]
+        depth = 1
+        try:
+            while True:
+                self.best_replies = {}
+                best_action = search(gameState, depth)
+                self.pv = self.principal_variation(gameState)
+                depth += 1
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+            self.best_replies = {}
+        return best_action
+
+    def principal_variation(self, gameState):
+        """
+        Follows the best replies of the last iteration from gameState
+        """
+        pv = {}
+        agent_index = 0
+        while (gameState, agent_index) in self.best_replies and (gameState, agent_index) not in pv:
+            action = self.best_replies[(gameState, agent_index)]
+            pv[(gameState, agent_index)] = action
+            gameState = gameState.generateSuccessor(agent_index, action)
+            agent_index = (agent_index + 1) % gameState.getNumAgents()
+        return pv
+
+    def ordered_actions(self, gameState, agent_index):
+        """
+        Returns the legal actions of an agent with the move of the principal
+        variation first, and raises SearchTimeout once the deadline has passed
+        """
+        actions = gameState.getLegalActions(agent_index)
+        if self.deadline == None:
+            return actions
+        if time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        pv_action = self.pv.get((gameState, agent_index))
+        if pv_action != None and actions[0] != pv_action:
+            actions = [pv_action] + [action for action in actions if action != pv_action]
+        return actions
+
+    def note_best_reply(self, gameState, agent_index, action):
+        if self.deadline != None:
+            self.best_replies[(gameState, agent_index)] = action
 
 class MinimaxAgent(MultiAgentSearchAgent):
     """
@@ -170,12 +426,15 @@ class MinimaxAgent(MultiAgentSearchAgent):
         if gameState.isWin() or gameState.isLose() or depth == 0:
             return evalFn(gameState), "Stop"
         else:
+            stored = self.lookup_value(gameState, depth, 0)
+            if stored != None: return stored
             v = -math.inf
             for action in gameState.getLegalActions(0):
                 v_temp = self.min_value(gameState.generateSuccessor(0, action), depth, num_agents, evalFn, 1)
                 if v_temp > v:
                     best_action = action
                     v = v_temp
+            self.store_value(gameState, depth, 0, v, best_action)
             return v,best_action
 
     def min_value(self, gameState, depth, num_agents, evalFn, ghost_index):
@@ -183,42 +442,143 @@ class MinimaxAgent(MultiAgentSearchAgent):
         if gameState.isWin() or gameState.isLose() or depth == 0:
             return evalFn(gameState)
         else:
+            stored = self.lookup_value(gameState, depth, ghost_index)
+            if stored != None: return stored[0]
             if ghost_index == num_agents-1: # The last ghost is now playing
                 v = math.inf
                 for action in gameState.getLegalActions(ghost_index):
                     v_temp,_ = self.max_value(gameState.generateSuccessor(ghost_index, action), depth-1, num_agents, evalFn)
                     if v_temp < v:
                         v = v_temp
-                return v
             else:
                 v = math.inf
                 for action in gameState.getLegalActions(ghost_index):
                     v_temp = self.min_value(gameState.generateSuccessor(ghost_index, action), depth, num_agents, evalFn, ghost_index+1)
                     if v_temp < v:
                         v = v_temp
-                return v
+            self.store_value(gameState, depth, ghost_index, v)
+            return v
 
 class AlphaBetaAgent(MultiAgentSearchAgent):
     """
     Your minimax agent with alpha-beta pruning (question 3)
+
+    The moves of a node can be ordered by any of these heuristics, joined
+    with '+' as in -a ordering=eval+killer+history:
+      eval     by the evaluation of their successors, in the first
+               orderingPlies plies
+      killer   the moves that caused a cutoff at the same depth first
+      history  by how often they caused cutoffs, keyed by agent, position
+               and action
+    With -a stats the successors generated and the cutoffs of each decision
+    are printed at the end of the game.
     """
+    ORDERINGS = ['eval', 'killer', 'history']
+
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', ordering = '', orderingPlies = '2',
+                 stats = '0', **args):
+        MultiAgentSearchAgent.__init__(self, evalFn, depth, **args)
+        self.ordering = [name for name in ordering.split('+') if name]
+        for name in self.ordering:
+            if name not in self.ORDERINGS:
+                raise Exception('Unknown move ordering: %s' % name)
+        self.orderingPlies = int(orderingPlies)
+        self.search_args.update(ordering=ordering, orderingPlies=orderingPlies)
+        self.showStats = int(stats)
+        self.killers = {} # (depth, agentIndex) -> the last two moves that caused a cutoff
+        self.history = util.Counter() # (agentIndex, position, action) -> cutoff score
+        self.generated = self.cutoffs = 0 # Of the current decision
+        self.decisions = self.total_generated = self.total_cutoffs = 0
 
     def getAction(self, gameState: GameState):
         """
         Returns the minimax action using self.depth and self.evaluationFunction
         """
         "*** YOUR CODE HERE ***"
-        action = self.alpha_beta_search(gameState, self.depth, gameState.getNumAgents(), self.evaluationFunction)
+        self.generated = self.cutoffs = 0
+        if self.timeLimit > 0:
+            action = self.iterative_deepening(gameState, lambda gameState, depth: self.alpha_beta_search(
+                gameState, depth, gameState.getNumAgents(), self.evaluationFunction))
+        elif self.use_workers():
+            action = self.parallel_decision(gameState)
+        else:
+            action = self.alpha_beta_search(gameState, self.depth, gameState.getNumAgents(), self.evaluationFunction)
+        self.decisions += 1
+        self.total_generated += self.generated
+        self.total_cutoffs += self.cutoffs
         return action
         util.raiseNotDefined()
+
+    def final(self, gameState):
+        MultiAgentSearchAgent.final(self, gameState)
+        if self.showStats and self.decisions > 0:
+            print('Alpha-beta: %d decisions, %.1f successors generated and %.1f cutoffs per decision' % (
+                self.decisions, self.total_generated / self.decisions, self.total_cutoffs / self.decisions))
+
+    """Utility functions for move ordering"""
+
+    def successor(self, gameState, agent_index, action):
+        self.generated += 1
+        return gameState.generateSuccessor(agent_index, action)
+
+    def ordered_actions(self, gameState, agent_index, depth):
+        """
+        Returns the legal actions of an agent, the move of the principal
+        variation first and the others sorted by self.ordering
+        """
+        actions = MultiAgentSearchAgent.ordered_actions(self, gameState, agent_index)
+        if not self.ordering or len(actions) < 2:
+            return actions
+        first = []
+        if self.pv.get((gameState, agent_index)) == actions[0]:
+            first, actions = actions[:1], actions[1:]
+        num_agents = gameState.getNumAgents()
+        ply = (self.root_depth - depth) * num_agents + agent_index
+        if 'eval' in self.ordering and ply < self.orderingPlies:
+            # Pacman tries the best successors first, the ghosts the worst ones
+            sign = -1 if agent_index == 0 else 1
+            values = dict((action, sign * self.evaluationFunction(self.successor(gameState, agent_index, action)))
+                          for action in actions)
+            return first + sorted(actions, key=lambda action: values[action])
+        killers = self.killers.get((depth, agent_index), []) if 'killer' in self.ordering else []
+        position = self.agent_position(gameState, agent_index)
+        def key(action):
+            history = self.history[(agent_index, position, action)] if 'history' in self.ordering else 0
+            return (action not in killers, -history)
+        return first + sorted(actions, key=key)
+
+    def note_cutoff(self, gameState, depth, agent_index, action):
+        self.cutoffs += 1
+        if 'killer' in self.ordering:
+            killers = self.killers.setdefault((depth, agent_index), [])
+            if action not in killers:
+                killers.insert(0, action)
+                del killers[2:]
+        if 'history' in self.ordering:
+            self.history[(agent_index, self.agent_position(gameState, agent_index), action)] += depth * depth
+
+    def agent_position(self, gameState, agent_index):
+        if agent_index == 0:
+            return gameState.getPacmanPosition()
+        return gameState.getGhostPosition(agent_index)
     
     """Utility functions for alpha-beta search"""
     
     def alpha_beta_search(self, gameState, depth, num_agents, evalFn):
+        self.root_depth = depth # To know the ply of a node
         a = -math.inf
         b = math.inf
         _, action = self.max_value(gameState, depth, num_agents, evalFn, a, b)
         return action
+
+    def root_move_value(self, gameState, action, a):
+        """
+        The value the root of alpha_beta_search gets for action when the best
+        root value so far is a
+        """
+        self.root_depth = self.depth
+        return self.min_value(self.successor(gameState, 0, action), self.depth, gameState.getNumAgents(),
+                              self.evaluationFunction, 1, a, math.inf)
     
     
     def max_value(self, gameState, depth, num_agents, evalFn, a, b):
@@ -226,15 +586,22 @@ class AlphaBetaAgent(MultiAgentSearchAgent):
         if gameState.isWin() or gameState.isLose() or depth == 0:
             return evalFn(gameState), "Stop"
         else:
+            stored = self.lookup_value(gameState, depth, 0, a, b)
+            if stored != None: return stored
+            a_start = a # The window the value is stored for
             v = -math.inf
-            for action in gameState.getLegalActions(0):
-                v_temp = self.min_value(gameState.generateSuccessor(0, action), depth, num_agents,
+            for action in self.ordered_actions(gameState, 0, depth):
+                v_temp = self.min_value(self.successor(gameState, 0, action), depth, num_agents,
                                         evalFn, 1, a, b)
                 if v_temp > v:
                     best_action = action
                     v = v_temp
-                if v > b: return v, action
+                if v > b:
+                    self.note_cutoff(gameState, depth, 0, action)
+                    break
                 a = max(a, v)
+            self.store_value(gameState, depth, 0, v, best_action, a_start, b)
+            self.note_best_reply(gameState, 0, best_action)
             return v,best_action
     
     def min_value(self, gameState, depth, num_agents, evalFn, ghost_index, a, b):
@@ -242,26 +609,36 @@ class AlphaBetaAgent(MultiAgentSearchAgent):
         if gameState.isWin() or gameState.isLose() or depth == 0:
             return evalFn(gameState)
         else:
+            stored = self.lookup_value(gameState, depth, ghost_index, a, b)
+            if stored != None: return stored[0]
+            b_start = b # The window the value is stored for
             if ghost_index == num_agents-1: # The last ghost is now playing
                 v = math.inf
-                for action in gameState.getLegalActions(ghost_index):
-                    v_temp, _ = self.max_value(gameState.generateSuccessor(ghost_index, action), depth-1, num_agents,
+                for action in self.ordered_actions(gameState, ghost_index, depth):
+                    v_temp, _ = self.max_value(self.successor(gameState, ghost_index, action), depth-1, num_agents,
                                               evalFn, a , b)
                     if v_temp < v:
+                        best_action = action
                         v = v_temp
-                    if v < a: return v
+                    if v < a:
+                        self.note_cutoff(gameState, depth, ghost_index, action)
+                        break
                     b = min(v, b)
-                return v
             else:
                 v = math.inf
-                for action in gameState.getLegalActions(ghost_index):
-                    v_temp = self.min_value(gameState.generateSuccessor(ghost_index, action), depth, num_agents, evalFn,
+                for action in self.ordered_actions(gameState, ghost_index, depth):
+                    v_temp = self.min_value(self.successor(gameState, ghost_index, action), depth, num_agents, evalFn,
                                             ghost_index+1, a, b)
                     if v_temp < v:
+                        best_action = action
                         v = v_temp
-                    if v < a: return v
+                    if v < a:
+                        self.note_cutoff(gameState, depth, ghost_index, action)
+                        break
                     b = min(v, b)
-                return v
+            self.store_value(gameState, depth, ghost_index, v, best_action, a, b_start)
+            self.note_best_reply(gameState, ghost_index, best_action)
+            return v
 
 class ExpectimaxAgent(MultiAgentSearchAgent):
     """
@@ -276,6 +653,11 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
         legal moves.
         """
         "*** YOUR CODE HERE ***"
+        if self.timeLimit > 0:
+            return self.iterative_deepening(gameState, lambda gameState, depth: self.expectimax_decision(
+                gameState, depth, gameState.getNumAgents(), self.evaluationFunction))
+        if self.use_workers():
+            return self.parallel_decision(gameState)
         action = self.expectimax_decision(gameState, self.depth, gameState.getNumAgents(),
                                           self.evaluationFunction)
         return action
@@ -287,6 +669,14 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
         _, action = self.max_value(gameState, depth, num_agents, evalFn)
         return action
 
+    def root_move_value(self, gameState, action, a):
+        """
+        The expected value of action at the root; there are no bounds to prune
+        with, so a is not used
+        """
+        return self.min_value(gameState.generateSuccessor(0, action), self.depth, gameState.getNumAgents(),
+                              self.evaluationFunction, 1)
+
     
     def max_value(self, gameState, depth, num_agents, evalFn):
         # Pacman makes a move
@@ -294,11 +684,12 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
             return evalFn(gameState), "Stop"
         else:
             v = -math.inf
-            for action in gameState.getLegalActions(0):
+            for action in self.ordered_actions(gameState, 0):
                 v_temp = self.min_value(gameState.generateSuccessor(0, action), depth, num_agents, evalFn, 1)
                 if v_temp > v:
                     best_action = action
                     v = v_temp
+            self.note_best_reply(gameState, 0, best_action)
             return v,best_action
         
     def min_value(self, gameState, depth, num_agents, evalFn, ghost_index):
@@ -306,6 +697,8 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
         if gameState.isWin() or gameState.isLose() or depth == 0:
             return evalFn(gameState)
         else:
+            stored = self.lookup_value(gameState, depth, ghost_index)
+            if stored != None: return stored[0]
             legal_actions = gameState.getLegalActions(ghost_index)
             v = 0
             N = len(legal_actions)
@@ -314,13 +707,192 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
                     v_temp,_ = self.max_value(gameState.generateSuccessor(ghost_index, action),
                                               depth-1, num_agents, evalFn)
                     v += (1/N)*v_temp
-                return v
             else:
                 for action in legal_actions:
                     v_temp = self.min_value(gameState.generateSuccessor(ghost_index, action),
                                             depth, num_agents, evalFn, ghost_index+1)
                     v += (1/N)*v_temp
-                return v
+            self.store_value(gameState, depth, ghost_index, v) # Expected values are exact
+            return v
+
+class MonteCarloNode:
+    """
+    A node of the Monte Carlo search tree: the state in which agent_index
+    moves, with the nodes of the moves tried from it
+    """
+    def __init__(self, state, agent_index):
+        self.state = state
+        self.agent_index = agent_index
+        self.children = {} # action -> MonteCarloNode
+        self.terminal = state.isWin() or state.isLose()
+        self.untried = []
+        if agent_index == 0 and not self.terminal:
+            self.untried = list(state.getLegalActions(0))
+            random.shuffle(self.untried)
+        self.visits = 0
+        self.total = 0.0
+
+    def expand(self, action):
+        num_agents = self.state.getNumAgents()
+        child = MonteCarloNode(self.state.generateSuccessor(self.agent_index, action),
+                               (self.agent_index + 1) % num_agents)
+        self.children[action] = child
+        return child
+
+class MonteCarloAgent(Agent):
+    """
+    A Monte Carlo tree search (UCT) agent.  Pacman's moves are chosen in the
+    tree by the UCB1 rule, the ghosts' moves are sampled from the rollout
+    policy, and each new leaf is valued by a rollout of rolloutDepth rounds
+    played by that policy and scored by evalFn:
+
+      rolloutPolicy=random       the ghosts move uniformly at random
+      rolloutPolicy=directional  the ghosts move as DirectionalGhost does
+
+    Pacman moves at random in rollouts, but never stops.  A move searches for
+    timeLimit milliseconds or iterations rollouts, whichever comes first, and
+    plays the most visited move.  The subtree of the state reached is kept
+    for the next move.
+    """
+    POLICIES = {'random': RandomGhost, 'directional': DirectionalGhost}
+
+    def __init__(self, evalFn = 'scoreEvaluationFunction', timeLimit = '100', iterations = '0',
+                 rolloutPolicy = 'random', rolloutDepth = '10', exploration = '1.4', reuse = '1'):
+        self.index = 0 # Pacman is always agent index 0
+        self.evaluationFunction = util.lookup(evalFn, globals())
+        self.timeLimit = int(timeLimit)
+        self.iterations = int(iterations)
+        if self.timeLimit <= 0 and self.iterations <= 0:
+            raise Exception('MonteCarloAgent needs a timeLimit or a number of iterations')
+        if rolloutPolicy not in self.POLICIES:
+            raise Exception('Unknown rollout policy: %s' % rolloutPolicy)
+        self.ghost_policy = self.POLICIES[rolloutPolicy]
+        self.ghosts = {} # agentIndex -> ghost agent of the rollout policy
+        self.rolloutDepth = int(rolloutDepth)
+        self.exploration = float(exploration)
+        self.reuse = int(reuse)
+        self.root = None
+        self.reused = self.decisions = 0
+
+    def getAction(self, gameState: GameState):
+        """
+        Returns the most visited move of the root after the search
+        """
+        self.root = self.find_root(gameState)
+        deadline = time.perf_counter() + self.timeLimit / 1000 if self.timeLimit > 0 else math.inf
+        iteration = 0
+        # The tree has no cycles, so the search goes without collections, which
+        # would interrupt it; the young objects it made are collected after it
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            while (self.iterations <= 0 or iteration < self.iterations) and \
+                    (iteration == 0 or time.perf_counter() < deadline):
+                self.search_once(self.root)
+                iteration += 1
+        finally:
+            if collecting:
+                gc.enable()
+                gc.collect(0)
+        action = max(self.root.children.items(), key=lambda item: item[1].visits)[0]
+        self.decisions += 1
+        self.root = self.root.children[action] if self.reuse else None
+        return action
+
+    def final(self, gameState):
+        self.root = None
+
+    """Utility functions for Monte Carlo tree search"""
+
+    def find_root(self, gameState):
+        """
+        Returns the node of gameState among the nodes the ghosts' replies to
+        the last move led to, or a new node if the tree does not have it
+        """
+        nodes = [self.root] if self.root != None else []
+        while nodes and nodes[0].agent_index != 0:
+            nodes = [child for node in nodes for child in node.children.values()]
+        for node in nodes:
+            if node.state == gameState:
+                self.reused += 1
+                return node
+        self.low, self.high = math.inf, -math.inf # The range of the rollout values, to scale them
+        return MonteCarloNode(gameState, 0)
+
+    def search_once(self, root):
+        """
+        Selects a path from the root, expands its leaf, rolls out from the new
+        node and backs the value up the path
+        """
+        node = root
+        path = [node]
+        while not node.terminal:
+            if node.agent_index == 0:
+                if node.untried:
+                    node = node.expand(node.untried.pop())
+                    path.append(node)
+                    break
+                node = node.children[self.select_action(node)]
+            else:
+                action = self.ghost_action(node.state, node.agent_index)
+                if action not in node.children:
+                    node = node.expand(action)
+                    path.append(node)
+                    break
+                node = node.children[action]
+            path.append(node)
+        value = self.rollout(node.state, node.agent_index)
+        self.low, self.high = min(self.low, value), max(self.high, value)
+        for node in path:
+            node.visits += 1
+            node.total += value
+
+    def select_action(self, node):
+        """
+        The UCB1 choice among the moves of Pacman, with the mean values scaled
+        to [0, 1] by the range of the rollout values seen so far
+        """
+        scale = self.high - self.low if self.high > self.low else 1
+        log_visits = math.log(node.visits)
+        best_action, best_score = None, -math.inf
+        for action, child in node.children.items():
+            score = (child.total / child.visits - self.low) / scale + \
+                    self.exploration * math.sqrt(log_visits / child.visits)
+            if score > best_score:
+                best_action, best_score = action, score
+        return best_action
+
+    def ghost_action(self, gameState, agent_index):
+        if agent_index not in self.ghosts:
+            self.ghosts[agent_index] = self.ghost_policy(agent_index)
+        return self.ghosts[agent_index].getAction(gameState)
+
+    def rollout(self, gameState, agent_index):
+        """
+        Plays rolloutDepth rounds from gameState, agent_index moving first,
+        and returns the evaluation of the state reached
+        """
+        num_agents = gameState.getNumAgents()
+        distributions = [] # Of the ghosts still to move in this round, for directional rollouts
+        for ply in range(self.rolloutDepth * num_agents):
+            if gameState.isWin() or gameState.isLose():
+                break
+            if agent_index == 0:
+                actions = [action for action in gameState.getLegalActions(0) if action != Directions.STOP]
+                action = random.choice(actions) if actions else Directions.STOP
+            elif self.ghost_policy == DirectionalGhost:
+                # A ghost's distribution only depends on itself and on Pacman, whom
+                # the other ghosts do not move, so those of a round are computed
+                # together; each ghost still samples its move when it plays
+                if not distributions:
+                    distributions = directionalDistributions([gameState], range(agent_index, num_agents))[0]
+                distribution = distributions.pop(0)
+                action = util.chooseFromDistribution(distribution) if distribution else Directions.STOP
+            else:
+                action = self.ghost_action(gameState, agent_index)
+            gameState = gameState.generateSuccessor(agent_index, action)
+            agent_index = (agent_index + 1) % num_agents
+        return self.evaluationFunction(gameState)
 
 def betterEvaluationFunction(currentGameState: GameState):
     """
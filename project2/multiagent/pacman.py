@@ -43,6 +43,7 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util
@@ -52,6 +53,8 @@ import types
 import time
 import random
 import os
+import math
+import atexit
 
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
@@ -121,12 +124,13 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
         else:
-            GhostRules.decrementTimer(state.data.agentStates[agentIndex])
+            GhostRules.decrementTimer(state.data.getMutableAgentState(agentIndex))
 
         # Resolve multi-agent effects
         GhostRules.checkDeath(state, agentIndex)
 
         # Book keeping
+        state.data.updateAgentHash(self.data)
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
         GameState.explored.add(self)
@@ -240,6 +244,15 @@ class GameState:
         state.data = self.data.deepCopy()
         return state
 
+    def shallowCopy(self):
+        """
+        Returns a copy that shares its data with this state (see
+        GameStateData.shallowCopy), for agents trusted not to write to it.
+        """
+        state = GameState(self)
+        state.data = self.data.shallowCopy()
+        return state
+
     def __eq__(self, other):
         """
         Allows two states to be compared.
@@ -283,11 +296,13 @@ class ClassicGameRules:
     def __init__(self, timeout=30):
         self.timeout = timeout
 
-    def newGame(self, layout, pacmanAgent, ghostAgents, display, quiet=False, catchExceptions=False):
+    def newGame(self, layout, pacmanAgent, ghostAgents, display, quiet=False, catchExceptions=False,
+                trustAgents=False, checkObservations=False):
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
         initState = GameState()
         initState.initialize(layout, len(ghostAgents))
-        game = Game(agents, display, self, catchExceptions=catchExceptions)
+        game = Game(agents, display, self, catchExceptions=catchExceptions,
+                    trustAgents=trustAgents, checkObservations=checkObservations)
         game.state = initState
         self.initialState = initState.deepCopy()
         self.quiet = quiet
@@ -359,7 +374,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.getMutableAgentState(0)
 
         # Update Configuration
         vector = Actions.directionToVector(action, PacmanRules.PACMAN_SPEED)
@@ -379,8 +394,7 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.removeFood(x, y)
             state.data._foodEaten = position
             # TODO: cache numFood?
             numFood = state.getNumFood()
@@ -389,11 +403,11 @@ class PacmanRules:
                 state.data._win = True
         # Eat capsule
         if(position in state.getCapsules()):
-            state.data.capsules.remove(position)
+            state.data.removeCapsule(position)
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range(1, len(state.data.agentStates)):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.getMutableAgentState(index).scaredTimer = SCARED_TIME
     consume = staticmethod(consume)
 
 
@@ -425,7 +439,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.getMutableAgentState(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0:
             speed /= 2.0
@@ -437,8 +451,8 @@ class GhostRules:
     def decrementTimer(ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint(
-                ghostState.configuration.pos)
+            ghostState.configuration = Configuration(nearestPoint(
+                ghostState.configuration.pos), ghostState.configuration.direction)
         ghostState.scaredTimer = max(0, timer - 1)
     decrementTimer = staticmethod(decrementTimer)
 
@@ -459,10 +473,12 @@ class GhostRules:
 
     def collide(state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
+            ghostState = state.data.getMutableAgentState(agentIndex)
             state.data.scoreChange += 200
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -516,7 +532,7 @@ def readCommand(argv):
     """
     parser = OptionParser(usageStr)
 
-    parser.add_option('-n', '--numGames', dest='numGames', type='int',
+    parser.add_option('-n', '--numGames', '--games', dest='numGames', type='int',
                       help=default('the number of GAMES to play'), metavar='GAMES', default=1)
     parser.add_option('-l', '--layout', dest='layout',
                       help=default(
@@ -543,7 +559,9 @@ def readCommand(argv):
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file (see gameRecords.py) to replay', default=None)
+    parser.add_option('--replayFrom', dest='replayFrom', type='int',
+                      help=default('The move from which to replay the recorded game'), default=0)
     parser.add_option('-a', '--agentArgs', dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -554,16 +572,38 @@ def readCommand(argv):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--trustAgents', action='store_true', dest='trustAgents',
+                      help='Hands the agents shallow copies of the state, that they must not write to', default=False)
+    parser.add_option('--checkObservations', action='store_true', dest='checkObservations',
+                      help='Stops the game if a trusted agent writes to the state it observed (slow)', default=False)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Plays the games headless over a pool of WORKERS processes, 0 plays them one by one as usual'),
+                      metavar='WORKERS', default=0)
+    parser.add_option('--seed', dest='seed', type='int',
+                      help=default('The random seed of the first game of a batch (--workers), game i uses SEED + i'), default=0)
+    parser.add_option('--layoutCache', dest='layoutCache',
+                      help='A file of parsed layouts, loaded at startup and saved at exit', default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
         raise Exception('Command line input not understood: ' + str(otherjunk))
     args = dict()
 
+    # Batch games are headless and independent of each other
+    if options.workers > 0:
+        if options.record or options.numTraining > 0 or options.gameToReplay != None:
+            raise Exception('Batch games (--workers) cannot be recorded, replayed or used for training')
+        options.quietGraphics = True
+
     # Fix the random seed
     if options.fixRandomSeed:
         random.seed('cs188')
 
+    # Keep the parsed layouts from run to run
+    if options.layoutCache:
+        layout.loadLayoutCache(options.layoutCache)
+        atexit.register(layout.saveLayoutCache, options.layoutCache)
+
     # Choose a layout
     args['layout'] = layout.getLayout(options.layout)
     if args['layout'] == None:
@@ -606,18 +646,19 @@ def readCommand(argv):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['trustAgents'] = options.trustAgents
+    args['checkObservations'] = options.checkObservations
+    if options.workers > 0:
+        del args['display'], args['record']
+        args['workers'] = options.workers
+        args['seed'] = options.seed
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print('Replaying recorded game %s.' % options.gameToReplay)
-        import pickle
-        f = open(options.gameToReplay)
-        try:
-            recorded = pickle.load(f)
-        finally:
-            f.close()
-        recorded['display'] = args['display']
-        replayGame(**recorded)
+        import gameRecords
+        recording = gameRecords.loadRecording(options.gameToReplay)
+        replayGame(recording, args['display'], options.replayFrom)
         sys.exit(0)
 
     return args
@@ -651,17 +692,27 @@ def loadAgent(pacman, nographics):
                     ' is not specified in any *Agents.py.')
 
 
-def replayGame(layout, actions, display):
+def replayGame(recording, display, startMove=0):
+    """
+    Replays a GameRecording (see gameRecords.py) from the state after
+    startMove moves, which is restored from the nearest checkpoint.
+    """
     import pacmanAgents
     import ghostAgents
+    import copy
     rules = ClassicGameRules()
     agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1)
-                                             for i in range(layout.getNumGhosts())]
-    game = rules.newGame(layout, agents[0], agents[1:], display)
-    state = game.state
+                                             for i in range(recording.numAgents - 1)]
+    game = rules.newGame(recording.layout, agents[0], agents[1:], display)
+    state = recording.stateAt(startMove)
+    if startMove > 0:
+        # The display draws the food and the capsules of the layout
+        state.data.layout = copy.copy(state.data.layout)
+        state.data.layout.food = state.data.food
+        state.data.layout.capsules = state.data.capsules
     display.initialize(state.data)
 
-    for action in actions:
+    for action in recording.getActions()[startMove:]:
             # Execute the action
         state = state.generateSuccessor(*action)
         # Change the display
@@ -672,7 +723,8 @@ def replayGame(layout, actions, display):
     display.finish()
 
 
-def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30):
+def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30,
+             trustAgents=False, checkObservations=False):
     import __main__
     __main__.__dict__['_display'] = display
 
@@ -689,21 +741,18 @@ def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, c
         else:
             gameDisplay = display
             rules.quiet = False
-        game = rules.newGame(layout, pacman, ghosts,
-                             gameDisplay, beQuiet, catchExceptions)
+        game = rules.newGame(layout, pacman, ghosts, gameDisplay, beQuiet,
+                             catchExceptions, trustAgents, checkObservations)
         game.run()
         if not beQuiet:
             games.append(game)
 
         if record:
             import time
-            import pickle
+            import gameRecords
             fname = ('recorded-game-%d' % (i + 1)) + \
                 '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            pickle.dump(components, f)
-            f.close()
+            gameRecords.GameRecording(layout, game.moveHistory, len(game.agents)).save(fname)
 
     if (numGames-numTraining) > 0:
         scores = [game.state.getScore() for game in games]
@@ -719,6 +768,75 @@ def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, c
     return games
 
 
+def playBatchGame(task):
+    """
+    Plays one game of a batch with the random seed of the game, without
+    display, and returns a summary of it. Module level, so that a process
+    pool can pickle it.
+    """
+    index, seed, layout, pacman, ghosts, catchExceptions, timeout, trustAgents, checkObservations = task
+    import textDisplay
+    random.seed(seed)
+    GameState.getAndResetExplored()
+    rules = ClassicGameRules(timeout)
+    rules.quiet = True
+    game = rules.newGame(layout, pacman, ghosts, textDisplay.NullGraphics(), True,
+                         catchExceptions, trustAgents, checkObservations)
+    game.run()
+    return {'index': index, 'seed': seed,
+            'score': game.state.getScore(), 'win': game.state.isWin(),
+            'moveTimes': game.moveTimes[0],
+            'explored': len(GameState.getAndResetExplored())}
+
+
+def percentile(values, fraction):
+    "The nearest-rank percentile of a sorted list of values"
+    return values[max(int(math.ceil(fraction * len(values))) - 1, 0)]
+
+
+def runBatch(layout, pacman, ghosts, numGames, workers, seed=0, catchExceptions=False, timeout=30,
+             trustAgents=False, checkObservations=False):
+    """
+    Plays numGames headless games over a pool of workers processes and
+    prints their aggregated results. Game i is played with the random seed
+    seed + i by copies of the agents as given, so every game has the same
+    result with any number of workers, one included.
+    """
+    tasks = [(i, seed + i, layout, pacman, ghosts, catchExceptions, timeout, trustAgents, checkObservations)
+             for i in range(numGames)]
+    if workers > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(playBatchGame, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        import copy
+        results = [playBatchGame(copy.deepcopy(task)) for task in tasks]
+
+    if numGames > 0:
+        scores = [result['score'] for result in results]
+        wins = [result['win'] for result in results]
+        moveTimes = sorted(t for result in results for t in result['moveTimes'])
+        explored = [result['explored'] for result in results]
+        print('Games:         %d (seeds %d-%d, workers: %d)' %
+              (numGames, seed, seed + numGames - 1, workers))
+        print('Average Score:', sum(scores) / float(len(scores)))
+        print('Scores:       ', ', '.join([str(score) for score in scores]))
+        print('Win Rate:      %d/%d (%.2f)' %
+              (wins.count(True), len(wins), wins.count(True) / float(len(wins))))
+        if moveTimes:
+            print('Move Times:    p50 %.2f ms, p90 %.2f ms, p99 %.2f ms, max %.2f ms' %
+                  tuple(1000 * t for t in [percentile(moveTimes, 0.5), percentile(moveTimes, 0.9),
+                                           percentile(moveTimes, 0.99), moveTimes[-1]]))
+        print('States:        %.1f explored per game, %d in total' %
+              (sum(explored) / float(len(explored)), sum(explored)))
+
+    return results
+
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
@@ -731,7 +849,10 @@ if __name__ == '__main__':
     > python pacman.py --help
     """
     args = readCommand(sys.argv[1:])  # Get game components based on input
-    runGames(**args)
+    if 'workers' in args:
+        runBatch(**args)
+    else:
+        runGames(**args)
 
     # import cProfile
     # cProfile.run("runGames( **args )")
@@ -0,0 +1,184 @@
+# test_multiAgents.py
+# -------------------
+# Unit tests of the search agents of multiAgents.py.
+
+"""
+Run from this directory with:
+
+> python -m unittest test_multiAgents
+"""
+
+import random
+import time
+import unittest
+from unittest import mock
+
+import ghostAgents
+import layout
+import multiAgents
+from game import Directions
+from ghostAgents import DirectionalGhost
+from pacman import GameState
+
+
+def playRandomly(layoutName, moves, seed):
+    "Returns the state after moves random moves of every agent"
+    random.seed(seed)
+    state = GameState()
+    lay = layout.getLayout(layoutName)
+    state.initialize(lay, lay.getNumGhosts())
+    for move in range(moves):
+        for agentIndex in range(state.getNumAgents()):
+            if state.isWin() or state.isLose():
+                return state
+            state = state.generateSuccessor(agentIndex, random.choice(state.getLegalActions(agentIndex)))
+    return state
+
+
+def scareGhosts(state, scaredTimer):
+    "Returns a copy of state in which the ghosts are scared for scaredTimer moves"
+    state = state.deepCopy()
+    for ghostState in state.data.agentStates[1:]:
+        ghostState.scaredTimer = scaredTimer
+    state.data._computeHashes()
+    return state
+
+
+def ghostByGhostRollout(agent, gameState, agentIndex):
+    "MonteCarloAgent.rollout, with each ghost's move computed by DirectionalGhost.getAction"
+    numAgents = gameState.getNumAgents()
+    for ply in range(agent.rolloutDepth * numAgents):
+        if gameState.isWin() or gameState.isLose():
+            break
+        if agentIndex == 0:
+            actions = [action for action in gameState.getLegalActions(0) if action != Directions.STOP]
+            action = random.choice(actions) if actions else Directions.STOP
+        else:
+            action = DirectionalGhost(agentIndex).getAction(gameState)
+        gameState = gameState.generateSuccessor(agentIndex, action)
+        agentIndex = (agentIndex + 1) % numAgents
+    return gameState
+
+
+class DirectionalRolloutTest(unittest.TestCase):
+
+    def testRolloutsMatchGhostByGhostMoves(self):
+        agent = multiAgents.MonteCarloAgent(timeLimit='0', iterations='1', rolloutPolicy='directional',
+                                            rolloutDepth='30')
+        agent.evaluationFunction = lambda state: state  # The rollout returns the state it reached
+        for layoutName in ['mediumClassic', 'minimaxClassic', 'powerClassic']:
+            for seed in range(5):
+                start = playRandomly(layoutName, seed * 3, seed)
+                if start.isWin() or start.isLose():
+                    continue
+                for agentIndex in range(start.getNumAgents()):
+                    self.checkRollout(agent, start, agentIndex, seed)
+                    self.checkRollout(agent, scareGhosts(start, 10), agentIndex, seed)
+
+    @unittest.skipUnless(ghostAgents._NUMPY_ENABLED, 'NumPy is not installed')
+    def testRolloutsMatchGhostByGhostMovesWithNumPy(self):
+        with mock.patch.object(ghostAgents, 'BATCH_MINIMUM', 1):
+            self.testRolloutsMatchGhostByGhostMoves()
+
+    def checkRollout(self, agent, start, agentIndex, seed):
+        random.seed(seed)
+        expected = ghostByGhostRollout(agent, start, agentIndex)
+        expectedRandomState = random.getstate()
+        random.seed(seed)
+        reached = agent.rollout(start, agentIndex)
+        self.assertEqual(reached, expected)
+        self.assertEqual(reached.getScore(), expected.getScore())
+        self.assertEqual(random.getstate(), expectedRandomState)
+
+
+class MonteCarloAgentTest(unittest.TestCase):
+
+    def startState(self, layoutName='mediumClassic'):
+        state = GameState()
+        lay = layout.getLayout(layoutName)
+        state.initialize(lay, lay.getNumGhosts())
+        return state
+
+    def countSearches(self, agent):
+        "Makes agent record the roots of its search_once calls, and returns the record"
+        searched = []
+        searchOnce = agent.search_once
+        agent.search_once = lambda root: (searched.append(root), searchOnce(root))
+        return searched
+
+    def testIterationsBoundTheSearch(self):
+        random.seed(0)
+        agent = multiAgents.MonteCarloAgent(timeLimit='0', iterations='25')
+        searched = self.countSearches(agent)
+        agent.getAction(self.startState())
+        self.assertEqual(len(searched), 25)
+        self.assertEqual(searched[0].visits, 25)
+
+    def testTimeLimitBoundsTheSearch(self):
+        random.seed(0)
+        agent = multiAgents.MonteCarloAgent(timeLimit='100', reuse='0')
+        state = self.startState()
+        searched = self.countSearches(agent)
+        start = time.perf_counter()
+        agent.getAction(state)
+        elapsed = time.perf_counter() - start
+        self.assertGreater(len(searched), 1)
+        self.assertLess(elapsed, 0.1 + 0.05)  # The budget, and the rollout under way when it ran out
+
+    def testSearchStopsAtTheFirstBound(self):
+        random.seed(0)
+        agent = multiAgents.MonteCarloAgent(timeLimit='60000', iterations='10', reuse='0')
+        state = self.startState()
+        searched = self.countSearches(agent)
+        agent.getAction(state)
+        self.assertEqual(len(searched), 10)
+
+    def testReusedSubtreeKeepsItsVisits(self):
+        random.seed(0)
+        agent = multiAgents.MonteCarloAgent(timeLimit='0', iterations='200')
+        state = self.startState()
+        action = agent.getAction(state)
+        # Reply with the ghost moves most visited by the search, whose node is in the tree
+        node = agent.root
+        state = state.generateSuccessor(0, action)
+        while node.agent_index != 0:
+            ghostAction, child = max(node.children.items(), key=lambda item: item[1].visits)
+            state = state.generateSuccessor(node.agent_index, ghostAction)
+            node = child
+        visits = node.visits
+        self.assertGreater(visits, 0)
+        agent.getAction(state)
+        self.assertEqual(agent.reused, 1)
+        self.assertEqual(node.visits, visits + 200)
+
+    def testRolloutPoliciesPlayDeterministically(self):
+        for policy in ['random', 'directional']:
+            games = []
+            for repeat in range(2):
+                random.seed(1)
+                agent = multiAgents.MonteCarloAgent(timeLimit='0', iterations='20', rolloutPolicy=policy)
+                ghosts = [DirectionalGhost(index) for index in range(1, 3)]
+                state = self.startState('smallClassic')
+                actions = []
+                for move in range(15):
+                    if state.isWin() or state.isLose():
+                        break
+                    action = agent.getAction(state)
+                    self.assertIn(action, state.getLegalActions(0))
+                    actions.append(action)
+                    state = state.generateSuccessor(0, action)
+                    for ghost in ghosts:
+                        if state.isWin() or state.isLose():
+                            break
+                        state = state.generateSuccessor(ghost.index, ghost.getAction(state))
+                agent.final(state)
+                games.append(actions)
+            self.assertEqual(games[0], games[1], policy)
+            self.assertGreater(len(games[0]), 0)
+
+    def testUnknownRolloutPolicy(self):
+        self.assertRaises(Exception, multiAgents.MonteCarloAgent, rolloutPolicy='greedy')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -641,14 +641,12 @@ def pause():
 
 # code to handle timeouts
 #
-# FIXME
-# NOTE: TimeoutFuncton is NOT reentrant.  Later timeouts will silently
-# disable earlier timeouts.  Could be solved by maintaining a global list
-# of active time outs.  Currently, questions which have test cases calling
-# this have all student code so wrapped.
+# TimeoutFunction calls are reentrant: the deadlines of all the active calls
+# are kept, and the timer is always armed for the earliest one.
 #
 import signal
 import time
+import threading
 
 
 class TimeoutFunctionException(Exception):
@@ -657,6 +655,17 @@ class TimeoutFunctionException(Exception):
 
 
 class TimeoutFunction:
+    """
+    Calls function and raises TimeoutFunctionException if it runs for more
+    than timeout seconds.  The timeout can be a float; it is enforced with
+    millisecond resolution.
+
+    In the main thread, a SIGALRM interval timer interrupts the function.  In
+    other threads, e.g. those of a thread pool running games, a watchdog
+    thread raises the exception in the thread of the function.  Where neither
+    is available, the time taken is checked after the function has returned.
+    """
+
     def __init__(self, function, timeout):
         self.timeout = timeout
         self.function = function
@@ -665,24 +674,155 @@ class TimeoutFunction:
         raise TimeoutFunctionException()
 
     def __call__(self, *args, **keyArgs):
-        # If we have SIGALRM signal, use it to cause an exception if and
-        # when this function runs too long.  Otherwise check the time taken
-        # after the method has returned, and throw an exception then.
-        if hasattr(signal, 'SIGALRM'):
-            old = signal.signal(signal.SIGALRM, self.handle_timeout)
-            signal.alarm(self.timeout)
-            try:
-                result = self.function(*args, **keyArgs)
-            finally:
-                signal.signal(signal.SIGALRM, old)
-            signal.alarm(0)
+        if self.timeout <= 0:
+            self.handle_timeout(None, None)
+        deadline = time.perf_counter() + self.timeout
+        if hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread():
+            timer = _ALARM_TIMER
+        elif _WATCHDOG.available:
+            timer = _WATCHDOG
         else:
-            startTime = time.time()
             result = self.function(*args, **keyArgs)
-            timeElapsed = time.time() - startTime
-            if timeElapsed >= self.timeout:
+            if time.perf_counter() >= deadline:
                 self.handle_timeout(None, None)
-        return result
+            return result
+        handle = timer.start(deadline)
+        try:
+            return self.function(*args, **keyArgs)
+        finally:
+            timer.stop(handle)
+
+
+class AlarmTimer:
+    """
+    Interrupts the main thread with SIGALRM when the earliest deadline of the
+    active TimeoutFunction calls has passed.  Each call costs two setitimer
+    system calls; the signal handler is installed while there are deadlines,
+    and the previous handler is restored once there are none.
+    """
+
+    def __init__(self):
+        self.deadlines = []
+        self.previousHandler = None
+
+    def start(self, deadline):
+        if not self.deadlines:
+            self.previousHandler = signal.signal(signal.SIGALRM, self.handle_alarm)
+        self.deadlines.append(deadline)
+        self.arm()
+        return deadline
+
+    def stop(self, deadline):
+        self.deadlines.remove(deadline)
+        self.arm()
+        if not self.deadlines:
+            previous = self.previousHandler
+            self.previousHandler = None
+            # A handler installed outside Python is reported as None
+            signal.signal(signal.SIGALRM, signal.SIG_DFL if previous is None else previous)
+
+    def arm(self):
+        if self.deadlines:
+            remaining = min(self.deadlines) - time.perf_counter()
+            signal.setitimer(signal.ITIMER_REAL, max(remaining, 0.0001))
+        else:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    def handle_alarm(self, signum, frame):
+        if self.deadlines and min(self.deadlines) <= time.perf_counter():
+            raise TimeoutFunctionException()
+        self.arm()
+
+
+class WatchdogDeadline:
+    """
+    The deadline of a TimeoutFunction call in a thread, which is either
+    cancelled by the call or fired by the watchdog, whichever comes first.
+    """
+    PENDING, CANCELLED, FIRED = range(3)
+
+    def __init__(self, deadline, threadId):
+        self.deadline = deadline
+        self.threadId = threadId
+        self.state = WatchdogDeadline.PENDING
+        self.lock = threading.Lock()  # Guards state, never held while raising
+        self.raised = threading.Lock()  # Released once the exception is raised
+        self.raised.acquire()
+
+    def __lt__(self, other):
+        return self.deadline < other.deadline
+
+
+class WatchdogTimer:
+    """
+    A daemon thread that raises TimeoutFunctionException in the threads whose
+    TimeoutFunction calls passed their deadline.  The exception is raised
+    with PyThreadState_SetAsyncExc, so it interrupts Python code only.
+
+    The exception can be delivered anywhere in the thread, so the watchdog
+    raises it without holding any lock, and the thread never holds a lock
+    the watchdog needs when it may be delivered.
+    """
+
+    def __init__(self):
+        try:
+            import ctypes
+            self.setAsyncExc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+            self.available = True
+        except (ImportError, AttributeError):
+            self.available = False
+        self.condition = threading.Condition()  # Guards timers
+        self.timers = []  # Heap of WatchdogDeadline
+        self.thread = None
+
+    def start(self, deadline):
+        timer = WatchdogDeadline(deadline, threading.get_ident())
+        with self.condition:
+            heapq.heappush(self.timers, timer)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='TimeoutFunction watchdog')
+                self.thread.daemon = True
+                self.thread.start()
+            if self.timers[0] is timer:
+                self.condition.notify()
+        return timer
+
+    def stop(self, timer):
+        import ctypes
+        with timer.lock:
+            if timer.state == WatchdogDeadline.PENDING:
+                timer.state = WatchdogDeadline.CANCELLED  # Removed from the heap when it reaches the top
+                return
+        # The watchdog fired first: once it has raised the exception, take it
+        # back if it has not been delivered yet
+        timer.raised.acquire()
+        self.setAsyncExc(ctypes.c_ulong(timer.threadId), None)
+
+    def run(self):
+        import ctypes
+        while True:
+            with self.condition:
+                while self.timers and self.timers[0].state != WatchdogDeadline.PENDING:
+                    heapq.heappop(self.timers)
+                if not self.timers:
+                    self.condition.wait()
+                    continue
+                remaining = self.timers[0].deadline - time.perf_counter()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                timer = heapq.heappop(self.timers)
+            with timer.lock:
+                if timer.state != WatchdogDeadline.PENDING:
+                    continue
+                timer.state = WatchdogDeadline.FIRED
+            self.setAsyncExc(ctypes.c_ulong(timer.threadId),
+                             ctypes.py_object(TimeoutFunctionException))
+            timer.raised.release()
+
+
+_ALARM_TIMER = AlarmTimer()
+_WATCHDOG = WatchdogTimer()
 
 
 _ORIGINAL_STDOUT = None